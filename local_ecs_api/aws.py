@@ -0,0 +1,317 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+from local_ecs_api.cache import TTLCache
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# number of seconds resolved task secret values are cached for (`0` disables caching)
+SECRET_CACHE_TTL = float(os.environ.get("SECRET_CACHE_TTL", 60))
+# maximum number of resolved task secret values to cache
+SECRET_CACHE_SIZE = int(os.environ.get("SECRET_CACHE_SIZE", 1024))
+# maximum number of names per SSM GetParameters call
+SSM_GET_PARAMETERS_MAX_NAMES = 10
+# maximum number of secret IDs per Secrets Manager BatchGetSecretValue call
+SECRETS_MANAGER_BATCH_MAX_IDS = 20
+# maximum number of concurrent Secrets Manager GetSecretValue calls
+SECRETS_MANAGER_MAX_WORKERS = 10
+
+# number of seconds before assumed role credentials expire that the credentials are
+# no longer used (credentials are refreshed in the background within twice the margin)
+ROLE_CREDENTIALS_REFRESH_MARGIN = float(
+    os.environ.get("ROLE_CREDENTIALS_REFRESH_MARGIN", 300)
+)
+
+# maximum number of HTTP connections each pooled AWS client keeps open
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 10))
+# maximum number of AWS clients to pool (clients for expired credentials are evicted)
+AWS_CLIENT_POOL_SIZE = int(os.environ.get("AWS_CLIENT_POOL_SIZE", 64))
+# environment variables of the custom endpoint URL for each AWS service
+ENDPOINT_URL_ENV_VARS = {
+    "ecs": "ECS_ENDPOINT_URL",
+    "sts": "STS_ENDPOINT",
+    "ssm": "SSM_ENDPOINT_URL",
+    "secretsmanager": "SECRET_MANAGER_ENDPOINT_URL",
+}
+
+SECRET_CACHE = TTLCache(maxsize=SECRET_CACHE_SIZE, ttl=SECRET_CACHE_TTL)
+
+
+class ClientPool:
+    """
+    Thread-safe pool of AWS clients keyed by service, endpoint URL and credentials.
+    Clients are created once and shared across requests given creating a client
+    loads the service's model.
+
+    Arguments:
+        maxsize: Maximum number of clients before the least recently used client is evicted
+        max_pool_connections: Maximum number of HTTP connections each client keeps open
+    """
+
+    def __init__(self, maxsize: int, max_pool_connections: int):
+        self.config = Config(max_pool_connections=max_pool_connections)
+        # session used for clients with the base AWS credentials
+        self.session = boto3.session.Session()
+        self._clients = TTLCache(maxsize=maxsize)
+        # boto3 sessions aren't thread-safe so clients are created one at a time
+        self._lock = threading.Lock()
+
+    def access_key(self, credentials: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """Returns the access key ID of the credentials or the base AWS credentials"""
+        if credentials:
+            return credentials["aws_access_key_id"]
+        with self._lock:
+            creds = self.session.get_credentials()
+        return creds.access_key if creds else None
+
+    def client(self, service: str, credentials: Optional[Dict[str, str]] = None):
+        """
+        Returns the AWS client for the service
+
+        Arguments:
+            service: AWS service name (e.g. `ecs`)
+            credentials: `aws_access_key_id`, `aws_secret_access_key` and
+                `aws_session_token` to create the client with. Defaults to the base
+                AWS credentials.
+        """
+        endpoint_url = os.environ.get(ENDPOINT_URL_ENV_VARS.get(service, ""))
+        key = (
+            service,
+            endpoint_url,
+            tuple(sorted(credentials.items())) if credentials else None,
+        )
+
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    session = (
+                        boto3.session.Session(**credentials)
+                        if credentials
+                        else self.session
+                    )
+                    client = session.client(
+                        service, endpoint_url=endpoint_url, config=self.config
+                    )
+                    self._clients.set(key, client)
+
+        return client
+
+    def warm(self) -> None:
+        """Creates the clients for the base AWS credentials of the services used by RunTask"""
+        for service in ENDPOINT_URL_ENV_VARS:
+            try:
+                self.client(service)
+            except Exception as err:
+                log.error("Failed to create AWS client: %s", service)
+                log.debug(err, exc_info=True)
+
+
+CLIENT_POOL = ClientPool(AWS_CLIENT_POOL_SIZE, AWS_MAX_POOL_CONNECTIONS)
+
+
+def _chunks(items: List[str], size: int) -> List[List[str]]:
+    chunks = []
+    for start in range(0, len(items), size):
+        end = start + size
+        chunks.append(items[start:end])
+    return chunks
+
+
+def get_ssm_parameters(ssm, value_froms: List[str]) -> Dict[str, str]:
+    """
+    Returns the decrypted SSM parameter values keyed by the parameter name or ARN using
+    one GetParameters call per 10 parameters
+
+    Arguments:
+        ssm: SSM client
+        value_froms: SSM parameter names or ARNs
+    """
+    values = {}
+    for chunk in _chunks(
+        list(dict.fromkeys(value_froms)), SSM_GET_PARAMETERS_MAX_NAMES
+    ):
+        # GetParameters accepts both parameter names and ARNs
+        response = ssm.get_parameters(Names=chunk, WithDecryption=True)
+        if response.get("InvalidParameters"):
+            raise Exception(f"Invalid SSM parameters: {response['InvalidParameters']}")
+
+        for param in response["Parameters"]:
+            for value_from in chunk:
+                if value_from in (param.get("ARN"), param["Name"]):
+                    values[value_from] = param["Value"]
+
+    unresolved = [value_from for value_from in value_froms if value_from not in values]
+    if unresolved:
+        raise Exception(f"Failed to resolve SSM parameters: {unresolved}")
+
+    return values
+
+
+def get_secrets_manager_values(sm, value_froms: List[str]) -> Dict[str, str]:
+    """
+    Returns the Secrets Manager secret strings keyed by the secret ID using
+    BatchGetSecretValue if the client supports it and concurrent GetSecretValue
+    calls otherwise
+
+    Arguments:
+        sm: Secrets Manager client
+        value_froms: Secrets Manager secret names or ARNs
+    """
+    values = {}
+    if hasattr(sm, "batch_get_secret_value"):
+        for chunk in _chunks(value_froms, SECRETS_MANAGER_BATCH_MAX_IDS):
+            response = sm.batch_get_secret_value(SecretIdList=chunk)
+            if response.get("Errors"):
+                raise Exception(f"Failed to get secrets: {response['Errors']}")
+
+            for secret in response["SecretValues"]:
+                for value_from in chunk:
+                    if value_from in (secret["ARN"], secret["Name"]):
+                        values[value_from] = secret["SecretString"]
+
+    # secrets that can't be matched to the batch results (e.g. partial ARNs without
+    # the random suffix) are retrieved individually
+    unresolved = [value_from for value_from in value_froms if value_from not in values]
+    if not unresolved:
+        return values
+
+    with ThreadPoolExecutor(
+        max_workers=min(SECRETS_MANAGER_MAX_WORKERS, len(unresolved))
+    ) as executor:
+        secrets = executor.map(
+            lambda value_from: sm.get_secret_value(SecretId=value_from), unresolved
+        )
+        for value_from, secret in zip(unresolved, secrets):
+            values[value_from] = secret["SecretString"]
+
+    return values
+
+
+def resolve_secrets(
+    value_froms: List[str], credentials: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Returns the SSM parameter and Secrets Manager values keyed by the input ARNs.
+    Duplicate ARNs are only retrieved once and values are cached by ARN and the
+    credentials used to retrieve them.
+
+    Arguments:
+        value_froms: SSM parameter or Secrets Manager secret ARNs
+        credentials: AWS credentials used to retrieve the values (see `ClientPool.client()`)
+    """
+    access_key = CLIENT_POOL.access_key(credentials)
+
+    values = {}
+    missing = {"ssm": [], "secretsmanager": []}
+    for value_from in dict.fromkeys(value_froms):
+        secret_type = value_from.split(":")[2]
+        if secret_type not in missing:
+            raise Exception(f"Secret type is not valid: {secret_type}")
+
+        value = SECRET_CACHE.get((value_from, access_key))
+        if value is None:
+            missing[secret_type].append(value_from)
+        else:
+            values[value_from] = value
+
+    resolved = {}
+    if missing["ssm"]:
+        ssm = CLIENT_POOL.client("ssm", credentials)
+        resolved.update(get_ssm_parameters(ssm, missing["ssm"]))
+
+    if missing["secretsmanager"]:
+        sm = CLIENT_POOL.client("secretsmanager", credentials)
+        resolved.update(get_secrets_manager_values(sm, missing["secretsmanager"]))
+
+    if SECRET_CACHE_TTL > 0:
+        for value_from, value in resolved.items():
+            SECRET_CACHE.set((value_from, access_key), value)
+
+    log.debug(
+        "Resolved %i secrets (%i cached)", len(values) + len(resolved), len(values)
+    )
+    values.update(resolved)
+
+    return values
+
+
+class RoleCredentialsCache:
+    """
+    Cache of assumed IAM role credentials keyed by the role ARN and the base
+    credentials used to assume the role. Credentials are reused until `refresh_margin`
+    seconds before they expire and are refreshed in the background beforehand.
+    Concurrent requests for the same role share a single AssumeRole call.
+
+    Arguments:
+        refresh_margin: Number of seconds before expiration that credentials are no longer used
+        session_name: Role session name used for the AssumeRole calls
+    """
+
+    def __init__(self, refresh_margin: float, session_name: str = "local-ecs-api"):
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.session_name = session_name
+        self._entries: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+        self._refreshing: Dict[Tuple[str, Optional[str]], Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="role-credentials"
+        )
+
+    def get(self, role_arn: str) -> Dict[str, Any]:
+        """
+        Returns the AssumeRole credentials for the role
+
+        Arguments:
+            role_arn: IAM role ARN
+        """
+        key = (role_arn, CLIENT_POOL.access_key())
+
+        with self._lock:
+            entry = self._entries.get(key)
+            now = datetime.now(timezone.utc)
+            if entry and now < entry["Expiration"] - self.refresh_margin:
+                if now >= entry["Expiration"] - 2 * self.refresh_margin:
+                    self._refresh(key)
+                return entry
+
+            future = self._refresh(key)
+
+        return future.result()
+
+    def _refresh(self, key: Tuple[str, Optional[str]]) -> Future:
+        """Returns the in-progress AssumeRole call for the key or starts one (lock must be held)"""
+        future = self._refreshing.get(key)
+        if future is None:
+            future = self._executor.submit(self._assume_role, key)
+            self._refreshing[key] = future
+        return future
+
+    def _assume_role(self, key: Tuple[str, Optional[str]]) -> Dict[str, Any]:
+        try:
+            log.debug("Assuming role: %s", key[0])
+            creds = CLIENT_POOL.client("sts").assume_role(
+                RoleArn=key[0], RoleSessionName=self.session_name
+            )["Credentials"]
+            with self._lock:
+                self._entries[key] = creds
+            return creds
+        except Exception as err:
+            log.error("Failed to assume role: %s", key[0])
+            log.debug(err, exc_info=True)
+            raise
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+
+ROLE_CREDENTIALS = RoleCredentialsCache(ROLE_CREDENTIALS_REFRESH_MARGIN)
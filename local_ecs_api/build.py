@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from local_ecs_api.cache import TTLCache
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# always rebuild the images of compose services with a `build` section on RunTask
+# instead of reusing the image built from unchanged build context content
+COMPOSE_FORCE_BUILD = os.environ.get("COMPOSE_FORCE_BUILD", "false").lower() == "true"
+# repository of the images built for compose services with a `build` section
+# (images are tagged with the hash of the service's build context)
+COMPOSE_BUILD_IMAGE_REPOSITORY = "local-ecs-build"
+
+
+class BuildContextHasher:
+    """
+    Hashes the content of docker build contexts and the service's build options so
+    that images built from unchanged build contexts can be reused. File digests are
+    cached by path, size and modification time so that unchanged files aren't
+    read again. The hash each image was last built from is kept for services with
+    an explicit image name given those images can't be tagged with the hash.
+
+    Arguments:
+        maxsize: Maximum number of file digests to cache
+    """
+
+    def __init__(self, maxsize: int = 65536):
+        self._digests = TTLCache(maxsize=maxsize)
+        # image name -> hash of the build context the image was last built from
+        self._built = TTLCache(maxsize=1024)
+
+    def _file_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            self._digests.set(key, digest)
+        return digest
+
+    def hash(self, build: Dict[str, Any]) -> Optional[str]:
+        """
+        Returns the SHA-256 hash of the build context's files and the build options
+        or None if the build context isn't a local directory (e.g. git URL)
+
+        Arguments:
+            build: Compose service `build` section with an absolute `context` path
+        """
+        context = build.get("context")
+        if not context or not os.path.isdir(context):
+            return
+
+        sha = hashlib.sha256()
+        sha.update(json.dumps(build, sort_keys=True, default=str).encode())
+
+        # Dockerfiles outside of the build context aren't hashed with the context
+        dockerfile = os.path.join(context, build.get("dockerfile") or "Dockerfile")
+        if os.path.relpath(dockerfile, context).startswith("..") and os.path.isfile(
+            dockerfile
+        ):
+            sha.update(self._file_digest(dockerfile).encode())
+
+        for root, dirs, files in os.walk(context):
+            # walks the context in a consistent order
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if not os.path.isfile(path):
+                    continue
+                sha.update(os.path.relpath(path, context).encode() + b"\0")
+                sha.update(self._file_digest(path).encode())
+
+        return sha.hexdigest()
+
+    @staticmethod
+    def tag(build_hash: str) -> str:
+        """Returns the image name tagged with the build context hash"""
+        return f"{COMPOSE_BUILD_IMAGE_REPOSITORY}:{build_hash[:32]}"
+
+    def image(self, build: Dict[str, Any]) -> Optional[str]:
+        """Returns the image name tagged with the hash of the build context"""
+        build_hash = self.hash(build)
+        if build_hash:
+            return self.tag(build_hash)
+
+    def is_built(self, image: str, build_hash: str) -> bool:
+        """Returns True if the image was last built from the build context hash"""
+        return self._built.get(image) == build_hash
+
+    def set_built(self, images: Dict[str, str]) -> None:
+        """
+        Records the build context hashes the images were built from
+
+        Arguments:
+            images: Mapping of image name to build context hash
+        """
+        for image, build_hash in images.items():
+            self._built.set(image, build_hash)
+
+
+BUILD_CONTEXTS = BuildContextHasher()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from tempfile import NamedTemporaryFile
+from typing import Any, Hashable, Optional
+from weakref import WeakValueDictionary
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# sentinel used to distinguish between a missing `ttl` argument and `ttl=None`
+_DEFAULT_TTL = object()
+
+
+class TTLCache:
+    """
+    Thread-safe least-recently-used cache with optional per-entry expiration
+
+    Arguments:
+        maxsize: Maximum number of entries before the least recently used entry is evicted
+        ttl: Default number of seconds an entry is valid for (`None` for no expiration)
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value associated with the key or `default` if the key is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Any = _DEFAULT_TTL) -> None:
+        """
+        Adds the value to the cache and evicts the least recently used entries if the
+        cache is full
+
+        Arguments:
+            key: Cache key
+            value: Value to cache
+            ttl: Number of seconds the entry is valid for. Defaults to the cache's `ttl`
+        """
+        if ttl is _DEFAULT_TTL:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes the key from the cache and returns the associated value"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """Removes all entries from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _DEFAULT_TTL) is not _DEFAULT_TTL
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class ComposeFileCache:
+    """
+    Content-addressed store of generated docker compose files. Entries are keyed by
+    the hash of the input the compose file was generated from and the least recently
+    used entries are removed once the store exceeds `max_entries` files.
+
+    Arguments:
+        directory: Directory to store the compose files within
+        max_entries: Maximum number of compose files to store (`0` disables the store)
+    """
+
+    def __init__(self, directory: str, max_entries: int = 256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # per-key locks that are removed once no thread holds a reference to them
+        self._key_locks = WeakValueDictionary()
+
+    @staticmethod
+    def key(content: Any) -> str:
+        """Returns the SHA-256 hash of the JSON serializable content"""
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def lock(self, key: str) -> threading.Lock:
+        """Returns the lock used to serialize generating the compose file for the key"""
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.yml")
+
+    def copy_to(self, key: str, path: str) -> bool:
+        """
+        Copies the compose file associated with the key to the path and returns True
+        if the compose file exists within the store and False otherwise
+        """
+        if self.max_entries <= 0:
+            return False
+
+        cached = self._path(key)
+        try:
+            shutil.copyfile(cached, path)
+            # marks the entry as recently used for eviction
+            os.utime(cached)
+        except FileNotFoundError:
+            return False
+
+        log.debug("Using cached compose file: %s", cached)
+        return True
+
+    def add(self, key: str, path: str) -> None:
+        """Adds a copy of the compose file at the path to the store"""
+        if self.max_entries <= 0:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        # writes to a temporary file first so concurrent readers never read a partial file
+        with NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as tmp:
+            with open(path, "rb") as src:
+                shutil.copyfileobj(src, tmp)
+        os.replace(tmp.name, self._path(key))
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Removes the least recently used compose files that exceed `max_entries`"""
+        with self._lock:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".yml"):
+                        try:
+                            entries.append((entry.stat().st_mtime, entry.path))
+                        except FileNotFoundError:
+                            continue
+
+            if len(entries) <= self.max_entries:
+                return
+
+            entries.sort()
+            for _, path in entries[: len(entries) - self.max_entries]:
+                log.debug("Evicting cached compose file: %s", path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
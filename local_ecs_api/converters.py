@@ -1,21 +1,23 @@
-import ipaddress
 import json
 import logging
 import os
-import random
-import re
 import shlex
-import struct
 import subprocess
 import uuid
 from glob import glob
 from pprint import pformat
 from tempfile import NamedTemporaryFile
+from typing import Dict, Optional
 
-import boto3
 import yaml
 from python_on_whales import DockerClient
-from python_on_whales.exceptions import DockerException
+from python_on_whales.utils import run
+
+from local_ecs_api.aws import ROLE_CREDENTIALS, resolve_secrets
+from local_ecs_api.build import BUILD_CONTEXTS, COMPOSE_FORCE_BUILD
+from local_ecs_api.cache import ComposeFileCache
+from local_ecs_api.images import IMAGE_PREFETCHER, task_definition_images
+from local_ecs_api.network import IPAllocator
 
 log = logging.getLogger("local-ecs-api")
 log.setLevel(logging.DEBUG)
@@ -29,32 +31,176 @@ EXTERNAL_NETWORKS = [
     net for net in os.environ.get("ECS_EXTERNAL_NETWORKS", "").split(",") if net != ""
 ]
 DOCKER_PROJECT_PREFIX = "local-ecs-task-"
+# use the ecs-cli binary instead of the native converter to generate task compose files
+USE_ECS_CLI = os.environ.get("USE_ECS_CLI", "false").lower() == "true"
+# IP address of the ECS endpoint container within the ECS_NETWORK_NAME network
+ECS_ENDPOINT_IP = "169.254.170.2"
+# subnet of the ECS_NETWORK_NAME network which limits the number of task containers
+# (must contain ECS_ENDPOINT_IP given AWS SDKs only retrieve credentials from it)
+ECS_NETWORK_SUBNET = os.environ.get("ECS_NETWORK_SUBNET", "169.254.170.0/24")
+# allocates the static IPs of the task containers within ECS_NETWORK_NAME
+ECS_NETWORK_IPS = IPAllocator(
+    DockerClient(),
+    ECS_NETWORK_NAME,
+    # reserves the link-local IPs AWS SDKs retrieve container credentials from
+    reserved=[ECS_ENDPOINT_IP, "169.254.170.23", "169.254.169.254"],
+)
+# content-addressed store of compose files generated from task definitions
+COMPOSE_FILE_CACHE = ComposeFileCache(
+    os.path.join(COMPOSE_DEST, ".compose-cache"),
+    max_entries=int(os.environ.get("COMPOSE_CACHE_MAX_ENTRIES", 256)),
+)
+
+
+def _go_duration(seconds: int) -> str:
+    """Returns the seconds formatted as a Go duration string (e.g. 90 -> `1m30s`)"""
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h{minutes}m{seconds}s"
+    if minutes:
+        return f"{minutes}m{seconds}s"
+    return f"{seconds}s"
+
+
+def container_definition_to_service(
+    container: dict, credentials_uri: str, labels: dict = None
+) -> dict:
+    """
+    Returns the docker compose service attributes for the ECS container definition.
+    Follows the conversion used by `ecs-cli local create`.
+
+    Arguments:
+        container: ECS container definition (or container override)
+        credentials_uri: AWS_CONTAINER_CREDENTIALS_RELATIVE_URI value for the service
+        labels: Additional docker labels to add to the service
+    """
+    environment = {
+        "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI": credentials_uri,
+        "ECS_CONTAINER_METADATA_URI": f"http://{ECS_ENDPOINT_IP}/v3",
+    }
+    for env in container.get("environment", []):
+        environment[env["name"]] = env["value"]
+    for secret in container.get("secrets", []):
+        # secret values are scoped to the container by using the container name as
+        # prefix and are interpolated from the `docker compose up` environment
+        environment[secret["name"]] = "${%s_%s}" % (container["name"], secret["name"])
+
+    linux_params = container.get("linuxParameters", {})
+    service = {
+        "image": container.get("image"),
+        "entrypoint": container.get("entryPoint"),
+        "command": container.get("command"),
+        "working_dir": container.get("workingDirectory"),
+        "hostname": container.get("hostname"),
+        "user": container.get("user"),
+        "dns": container.get("dnsServers"),
+        "dns_search": container.get("dnsSearchDomains"),
+        "links": container.get("links"),
+        "privileged": container.get("privileged"),
+        "read_only": container.get("readonlyRootFilesystem"),
+        "security_opt": container.get("dockerSecurityOptions"),
+        "environment": environment,
+        "labels": {**container.get("dockerLabels", {}), **(labels or {})},
+        "networks": {ECS_NETWORK_NAME: None},
+        "cap_add": linux_params.get("capabilities", {}).get("add"),
+        "cap_drop": linux_params.get("capabilities", {}).get("drop"),
+        "init": linux_params.get("initProcessEnabled"),
+        "cpu_shares": container.get("cpu") or None,
+        "mem_limit": f"{container['memory']}m" if container.get("memory") else None,
+        "mem_reservation": f"{container['memoryReservation']}m"
+        if container.get("memoryReservation")
+        else None,
+    }
+
+    if container.get("extraHosts"):
+        service["extra_hosts"] = [
+            f"{host['hostname']}:{host['ipAddress']}"
+            for host in container["extraHosts"]
+        ]
+
+    if container.get("portMappings"):
+        service["ports"] = []
+        for mapping in container["portMappings"]:
+            port = {"target": mapping["containerPort"]}
+            if mapping.get("hostPort"):
+                port["published"] = mapping["hostPort"]
+            if mapping.get("protocol"):
+                port["protocol"] = mapping["protocol"]
+            service["ports"].append(port)
+
+    if container.get("dependsOn"):
+        service["depends_on"] = [dep["containerName"] for dep in container["dependsOn"]]
+
+    if container.get("healthCheck"):
+        health_check = container["healthCheck"]
+        service["healthcheck"] = {
+            "test": health_check["command"],
+            "interval": _go_duration(health_check.get("interval", 30)),
+            "timeout": _go_duration(health_check.get("timeout", 5)),
+            "retries": health_check.get("retries", 3),
+        }
+        if health_check.get("startPeriod"):
+            service["healthcheck"]["start_period"] = _go_duration(
+                health_check["startPeriod"]
+            )
 
+    if container.get("ulimits"):
+        service["ulimits"] = {
+            ulimit["name"]: {"soft": ulimit["softLimit"], "hard": ulimit["hardLimit"]}
+            for ulimit in container["ulimits"]
+        }
+
+    if container.get("logConfiguration"):
+        service["logging"] = {
+            "driver": container["logConfiguration"]["logDriver"],
+            "options": container["logConfiguration"].get("options"),
+        }
 
-def random_ip(network: str) -> str:
+    # omits unset attributes similar to ecs-cli
+    return {
+        key: value
+        for key, value in service.items()
+        if value is not None and value != [] and value != {} and value is not False
+    }
+
+
+def task_definition_to_compose(task_def: dict) -> dict:
     """
-    Returns a random IPv4 IP address within the scope of the input CIDR range
+    Returns the docker compose file content for the ECS task definition. Services are
+    configured to retrieve AWS credentials for the task definition's task role from
+    the ECS endpoint container similar to `ecs-cli local create --use-role`.
 
     Arguments:
-        network: CIDR range
+        task_def: ECS task definition (or task overrides with containerDefinitions)
     """
-    network = ipaddress.IPv4Network(network)
-    (network_int,) = struct.unpack(
-        "!I", network.network_address.packed
-    )  # make network address into an integer
-    rand_bits = (
-        network.max_prefixlen - network.prefixlen
-    )  # calculate the needed bits for the host part
-    rand_host_int = random.randint(0, 2**rand_bits - 1)  # generate random host part
-    ip_address = ipaddress.IPv4Address(network_int + rand_host_int)  # combine the parts
+    credentials_uri = "/creds"
+    if task_def.get("taskRoleArn"):
+        credentials_uri = "/role/" + task_def["taskRoleArn"].rsplit("/", maxsplit=1)[-1]
+
+    labels = {}
+    if task_def.get("taskDefinitionArn"):
+        labels = {
+            "ecs-local.task-definition-input.type": "remote",
+            "ecs-local.task-definition-input.value": task_def["taskDefinitionArn"],
+        }
 
-    return ip_address.exploded
+    return {
+        "version": "3.4",
+        "services": {
+            container["name"]: container_definition_to_service(
+                container, credentials_uri, labels
+            )
+            for container in task_def.get("containerDefinitions", [])
+        },
+        "networks": {ECS_NETWORK_NAME: {"external": True}},
+    }
 
 
 class DockerTask:
     """Handles creating and running local docker compose projects from ECS task definition"""
 
-    def __init__(self, task_def: dict):
+    def __init__(self, task_def: dict, task_id: Optional[str] = None):
         self.task_def: str = task_def["taskDefinition"]
         self.task_def_arn: str = self.task_def["taskDefinitionArn"]
         self.task_name: str = (
@@ -62,7 +208,7 @@ class DockerTask:
             .replace("-", "_")
             .replace(":", "-v")
         )
-        self.id: str = str(uuid.uuid4())
+        self.id: str = task_id or str(uuid.uuid4())
         self.compose_dir: str = os.path.join(
             COMPOSE_DEST, f".{self.task_name}-{self.id[:4]}"
         )
@@ -76,30 +222,61 @@ class DockerTask:
         self.compose_network_filepath = os.path.join(
             self.compose_dir, "docker-compose.ecs-local.task-network-override.yml"
         )
+        self.compose_build_filepath = os.path.join(
+            self.compose_dir, "docker-compose.ecs-local.build-override.yml"
+        )
+        self.compose_labels_filepath = os.path.join(
+            self.compose_dir, "docker-compose.ecs-local.labels-override.yml"
+        )
 
         self.docker = DockerClient(
             compose_project_name=DOCKER_PROJECT_PREFIX + self.id,
             compose_project_directory=self.compose_dir,
         )
         self.docker.client_config.compose_files = []
-        self.docker_ecs_endpoint = DockerClient(
-            compose_files=[
-                os.path.join(
-                    os.path.dirname(__file__), "docker-compose.local-endpoint.yml"
-                )
-            ]
-        )
+        # env vars of the task's created but not started containers (see `up()`)
+        self.created_env: Optional[Dict[str, str]] = None
+        # explicit image names of build services -> build context hash to rebuild from
+        self.build_images: Dict[str, str] = {}
 
     def generate_local_task_compose_file(self, task_def: dict, path: str) -> str:
         """
-        Creates docker compose file based on input ECS task definition
+        Creates docker compose file based on input ECS task definition. Compose files
+        previously generated from the same task definition are reused.
+
+        Arguments:
+            task_def: ECS task definition
+            path: Absolute path to output the docker compose file to
+        """
+        key = COMPOSE_FILE_CACHE.key({"use_ecs_cli": USE_ECS_CLI, "task_def": task_def})
+        # tasks launched by the same RunTask request wait for the first task to
+        # generate the compose file instead of each generating it
+        with COMPOSE_FILE_CACHE.lock(key):
+            if COMPOSE_FILE_CACHE.copy_to(key, path):
+                return path
+
+            if USE_ECS_CLI:
+                self.generate_ecs_cli_task_compose_file(task_def, path)
+            else:
+                with open(path, "w+") as f:
+                    yaml.dump(task_definition_to_compose(task_def), f)
+
+            COMPOSE_FILE_CACHE.add(key, path)
+
+        return path
+
+    @staticmethod
+    def generate_ecs_cli_task_compose_file(task_def: dict, path: str) -> str:
+        """
+        Creates docker compose file based on input ECS task definition via the
+        `ecs-cli local create` command
 
         Arguments:
             task_def: ECS task definition
             path: Absolute path to output the docker compose file to
         """
         with NamedTemporaryFile(delete=False, mode="w+") as tmp:
-            json.dump(task_def, tmp)
+            json.dump(task_def, tmp, default=str)
             tmp.flush()
 
             cmd = f"ecs-cli local create --force --task-def-file {tmp.name} --output {path} --use-role"
@@ -121,10 +298,18 @@ class DockerTask:
 
         if overrides:
             log.info("Creating overrides task definition")
-            overrides["containerDefinitions"] = overrides.pop("containerOverrides")
+            # copies overrides to avoid mutating the RunTask request's overrides
+            task_overrides = {
+                key: value
+                for key, value in overrides.items()
+                if key != "containerOverrides"
+            }
+            task_overrides["containerDefinitions"] = overrides.get(
+                "containerOverrides", []
+            )
 
             self.generate_local_task_compose_file(
-                overrides, self.compose_run_task_overrides_filepath
+                task_overrides, self.compose_run_task_overrides_filepath
             )
             self.docker.client_config.compose_files.append(
                 self.compose_run_task_overrides_filepath
@@ -149,137 +334,217 @@ class DockerTask:
 
         self.docker.client_config.compose_files.extend(list(compose_files))
 
-    def setup_task_secrets(self) -> None:
-        """
-        Sets environment variables for the task's AWS Secret Manager and System Manager Parameter Store values.
-        The AWS credentials needed to retrieve the values must be set beforehand.
+    def get_task_secrets(
+        self, credentials: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
         """
-        ssm = boto3.client("ssm", endpoint_url=os.environ.get("SSM_ENDPOINT_URL"))
-        sm = boto3.client(
-            "secretsmanager", endpoint_url=os.environ.get("SECRET_MANAGER_ENDPOINT_URL")
-        )
+        Returns the environment variables for the task's AWS Secret Manager and System
+        Manager Parameter Store values
 
+        Arguments:
+            credentials: AWS credentials used to retrieve the values (defaults to the
+                base AWS credentials)
+        """
+        secrets = {}
         for container in self.task_def["containerDefinitions"]:
             for secret in container.get("secrets", []):
                 # scopes env vars to container by using container name as prefix.
-                # when ecs-cli converts task def to compose, it will convert
-                # all secrets to use this format within compose environment section
-                name = f"{container['name']}_{secret['name']}"
-                secret_type = secret["valueFrom"].split(":")[2]
-
-                if secret_type == "ssm":
-                    os.environ[name] = ssm.get_parameter(
-                        Name=secret["valueFrom"]
-                        .split(":")[-1]
-                        .removeprefix("parameter/"),
-                        WithDecryption=True,
-                    )["Parameter"]["Value"]
-                elif secret_type == "secretsmanager":
-                    os.environ[name] = sm.get_secret_value(
-                        SecretId=secret["valueFrom"]
-                    )["SecretString"]
-                else:
-                    raise Exception(f"Secret type is not valid: {secret_type}")
-
-    def assume_task_execution_role(self, execution_role: str) -> None:
+                # when the task def is converted to compose, all secrets are converted
+                # to use this format within compose environment section
+                secrets[f"{container['name']}_{secret['name']}"] = secret["valueFrom"]
+
+        values = resolve_secrets(list(secrets.values()), credentials)
+        return {name: values[value_from] for name, value_from in secrets.items()}
+
+    def assume_task_execution_role(self, execution_role: str) -> Dict[str, str]:
         """
-        Assumes the ECS task definition's associated task execution role
+        Assumes the ECS task definition's associated task execution role and returns
+        the role's AWS credentials environment variables
 
         Arguments:
             execution_role: ECS task execution role ARN
         """
         log.debug(f"Using task execution role: {execution_role}")
-        sts = boto3.client("sts", endpoint_url=os.environ.get("STS_ENDPOINT"))
-
-        creds = sts.assume_role(
-            RoleArn=execution_role, RoleSessionName=f"LocalTask-{self.id}"
-        )["Credentials"]
-
-        os.environ["AWS_ACCESS_KEY_ID"] = creds["AccessKeyId"]
-        os.environ["AWS_SECRET_ACCESS_KEY"] = creds["SecretAccessKey"]
-        os.environ["AWS_SESSION_TOKEN"] = creds["SessionToken"]
-
-    def ecs_endpoint_up(self) -> None:
-        """Setup and run docker compose up for ECS endpoint"""
-        if all(
-            [
-                os.environ.get("ECS_ENDPOINT_AWS_PROFILE"),
-                os.environ.get("ECS_AWS_CREDS_VOLUME_NAME"),
-            ]
-        ):
-            log.debug(
-                "Using AWS credentials volume mount override file for ECS endpoint"
-            )
-            creds_overwrite_path = os.path.join(
-                os.path.dirname(__file__), "docker-compose.local-endpoint.aws_creds.yml"
-            )
+        creds = ROLE_CREDENTIALS.get(execution_role)
 
-            if creds_overwrite_path not in self.docker.client_config.compose_files:
-                # adds volume as an external volume in endpoint compose project
-                self.docker_ecs_endpoint.client_config.compose_files.append(
-                    creds_overwrite_path
-                )
+        return {
+            "AWS_ACCESS_KEY_ID": creds["AccessKeyId"],
+            "AWS_SECRET_ACCESS_KEY": creds["SecretAccessKey"],
+            "AWS_SESSION_TOKEN": creds["SessionToken"],
+        }
 
-        self.docker_ecs_endpoint.compose.up(quiet=True, detach=True)
+    def generate_local_compose_labels_file(
+        self, path: str, labels: Dict[str, str]
+    ) -> None:
+        """
+        Creates docker compose file that adds the docker labels to all of the task's
+        services. The task's network compose file must be created beforehand.
 
-        log.debug("Adding custom external docker networks to ECS endpoint container")
-        for network in EXTERNAL_NETWORKS:
-            endpoint_container_name = (
-                self.docker_ecs_endpoint.compose.config()
-                .services["ecs-local-endpoints"]
-                .container_name
+        Arguments:
+            path: Absolute path to output the docker compose file to
+            labels: Docker labels to add to the services
+        """
+        # the network compose file contains all of the task's services
+        with open(self.compose_network_filepath) as f:
+            services = yaml.safe_load(f)["services"]
+
+        with open(path, "w+") as f:
+            yaml.dump(
+                {
+                    "version": "3.4",
+                    "services": {service: {"labels": labels} for service in services},
+                },
+                f,
             )
-            try:
-                self.docker_ecs_endpoint.network.connect(
-                    network, endpoint_container_name
-                )
-            except DockerException as err:
-                if re.search(r"already exists in network", err.stderr):
-                    log.debug("Container is already associated")
-                else:
-                    raise err
-
-    def up(self, count: int, overrides=None) -> None:
+        if path not in self.docker.client_config.compose_files:
+            self.docker.client_config.compose_files.append(path)
+
+    def create(self, overrides=None, labels: Optional[Dict[str, str]] = None) -> None:
         """
-        Runs ECS endpoint if not exists and run ECS task locally
+        Generates the task's docker compose files. The ECS endpoint must be running
+        beforehand (see `local_ecs_api.endpoint`).
 
         Arguments:
-            count: (Not supported) Number of docker compose projects that should be created for task
-            overrides: List of container overrides
+            overrides: ECS task and container overrides
+            labels: Docker labels to add to the task's containers
         """
-        log.info("Running ECS endpoint service")
-        self.ecs_endpoint_up()
-
         log.info("Generating docker compose files")
         self.create_docker_compose_stack(overrides)
+        if labels:
+            self.generate_local_compose_labels_file(
+                self.compose_labels_filepath, labels
+            )
         log.debug("Compose files:")
         log.debug(pformat(self.docker.client_config.compose_files))
 
-        # preserve env vars before creating docker compose related env vars
-        _environ = os.environ.copy()
+    def up(self, overrides=None, start: bool = True) -> None:
+        """
+        Runs ECS task locally. The task's docker compose files must be created
+        beforehand via `create()`.
 
+        Arguments:
+            overrides: ECS task and container overrides
+            start: Start the task's containers. If False, the containers are only
+                created and can be started later via `start()`.
+        """
         execution_role = self.task_def.get("executionRoleArn")
         if overrides:
             execution_role = overrides.get("executionRoleArn", execution_role)
 
-        try:
-            if execution_role:
-                log.info("Assuming task execution role")
-                self.assume_task_execution_role(execution_role)
+        # env vars are only passed to the task's docker compose process so that
+        # concurrent launches don't share credentials or secrets
+        env = {}
+        credentials = None
+        if execution_role:
+            log.info("Assuming task execution role")
+            env.update(self.assume_task_execution_role(execution_role))
+            credentials = {
+                "aws_access_key_id": env["AWS_ACCESS_KEY_ID"],
+                "aws_secret_access_key": env["AWS_SECRET_ACCESS_KEY"],
+                "aws_session_token": env["AWS_SESSION_TOKEN"],
+            }
+
+        log.info("Setting env vars for task secrets")
+        env.update(self.get_task_secrets(credentials))
 
-            log.info("Setting env vars for task secrets")
-            self.setup_task_secrets()
+        build = self.generate_local_compose_build_file(self.compose_build_filepath, env)
 
-            for i in range(count):
-                log.debug("Count: %i/%i", i + 1, count)
-                self.docker.compose.up(
-                    quiet=True, build=True, detach=True, log_prefix=False
-                )
+        # shares the background pulls of the task's images instead of pulling the
+        # images again (images on disk aren't pulled by docker compose)
+        IMAGE_PREFETCHER.wait(task_definition_images(self.task_def))
 
+        run(
+            self.docker.docker_compose_cmd
+            + ["up"]
+            + (["--build"] if build else [])
+            + (["--detach"] if start else ["--no-start"])
+            + ["--no-log-prefix"],
+            env=env,
+        )
+        if build:
+            BUILD_CONTEXTS.set_built(self.build_images)
+        if not start:
+            # compose files are interpolated with the same env vars when started
+            self.created_env = env
+
+    def start(self) -> None:
+        """Starts the task's containers created via `up(start=False)`"""
+        run(self.docker.docker_compose_cmd + ["start"], env=self.created_env)
+        self.created_env = None
+
+    def down(self) -> None:
+        """Removes the task's docker compose project and releases the task's IPs"""
+        try:
+            # env vars are only set if the task's containers were created
+            run(self.docker.docker_compose_cmd + ["down"], env=self.created_env or {})
         finally:
-            # removes secrets used in docker compose up environment
-            os.environ.clear()
-            os.environ.update(_environ)
+            ECS_NETWORK_IPS.release(self.id)
+
+    def generate_local_compose_build_file(self, path: str, env: Dict[str, str]) -> bool:
+        """
+        Creates docker compose file that tags the images of the services with a
+        `build` section and no explicit `image` with the hash of the service's build
+        context. Images built from unchanged build contexts are reused given docker
+        compose only builds images that don't exist. Explicit images are kept and
+        are rebuilt if they weren't last built from the current build context hash.
+        Returns True if the images need to be rebuilt with `--build` and False
+        otherwise.
+
+        Arguments:
+            path: Absolute path to output the docker compose file to
+            env: Environment variables used to interpolate the compose files
+        """
+        has_build = False
+        for compose_file in self.docker.client_config.compose_files:
+            with open(compose_file) as f:
+                content = yaml.safe_load(f) or {}
+            if any(
+                "build" in (service or {})
+                for service in (content.get("services") or {}).values()
+            ):
+                has_build = True
+                break
+
+        if not has_build:
+            return False
+        if COMPOSE_FORCE_BUILD:
+            return True
+
+        config = json.loads(
+            run(
+                self.docker.docker_compose_cmd + ["config", "--format", "json"],
+                env=env,
+            )
+        )
+        services = {}
+        self.build_images = {}
+        for name, service in config["services"].items():
+            if "build" not in service:
+                continue
+            build_hash = BUILD_CONTEXTS.hash(service["build"])
+            if build_hash is None:
+                # remote build contexts can't be hashed
+                return True
+
+            image = service.get("image")
+            if image is None:
+                services[name] = {"image": BUILD_CONTEXTS.tag(build_hash)}
+            elif not BUILD_CONTEXTS.is_built(image, build_hash):
+                self.build_images[image] = build_hash
+
+        if services:
+            log.debug("Tagging service images with build context hashes: %s", services)
+            with open(path, "w+") as f:
+                yaml.dump({"version": "3.4", "services": services}, f)
+            if path not in self.docker.client_config.compose_files:
+                self.docker.client_config.compose_files.append(path)
+
+        if self.build_images:
+            log.debug(
+                "Rebuilding images with changed build contexts: %s", self.build_images
+            )
+
+        return bool(self.build_images)
 
     def generate_local_compose_network_file(self, path: str, task_role_arn) -> dict:
         """
@@ -291,19 +556,6 @@ class DockerTask:
             path: Absolute path to output the docker compose file to
             task_role_arn: ECS task role ARN
         """
-        docker_inspect = self.docker.network.inspect(ECS_NETWORK_NAME)
-        network_subnet_cidr = docker_inspect.ipam.config[0]["Subnet"]
-
-        # get list of IPs already assigned within docker network
-        # network subnet/gateway IPs
-        # NOTE: can't rely on docker network inspect results to get Gateway IP given
-        # it's not always an attribute in ipam config (only Subnet)
-        subnet_ip = network_subnet_cidr.split("/")[0]
-        assigned = [subnet_ip, subnet_ip[:-2] + ".1"]
-        assigned.extend(
-            [attr.ipv4_address for attr in docker_inspect.containers.values()]
-        )
-
         # compose service network attribute
         service_networks = {}
         # compose service network attribute for custom external networks
@@ -318,20 +570,16 @@ class DockerTask:
 
         # parses docker compose file for task into Config object
         config = self.docker.compose.config()
-        for service in config.services:
-            rand_ip = None
-            # gets random IP that isn't assigned within docker network
-            while rand_ip is None or rand_ip in assigned:
-                rand_ip = random_ip(network_subnet_cidr)
-            assigned.append(rand_ip)
-
+        # reserves an IP that isn't assigned within docker network for each service
+        ips = ECS_NETWORK_IPS.allocate(self.id, len(config.services))
+        for service, ip in zip(config.services, ips):
             service_networks[service] = {
                 "environment": [
                     "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI=/role/"
                     + task_role_arn.rsplit("/", maxsplit=1)[-1]
                 ],
                 "networks": {
-                    **{ECS_NETWORK_NAME: {"ipv4_address": rand_ip}},
+                    **{ECS_NETWORK_NAME: {"ipv4_address": ip}},
                     **external_service_networks,
                 },
             }
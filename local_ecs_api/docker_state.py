@@ -0,0 +1,313 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from python_on_whales import DockerClient
+from python_on_whales.components.container.models import ContainerInspectResult
+from python_on_whales.exceptions import DockerException
+from python_on_whales.utils import format_dict_for_cli, run
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# labels docker compose adds to the containers of a compose project
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+COMPOSE_SERVICE_LABEL = "com.docker.compose.service"
+COMPOSE_WORKING_DIR_LABEL = "com.docker.compose.project.working_dir"
+# label of the containers of warm pool tasks set to the PID of the API process that
+# created the task so that tasks orphaned by a crashed process can be removed
+WARM_TASK_LABEL = "local-ecs-api.warm-task.pid"
+# serve task container state from an in-memory cache maintained by `docker events`
+USE_DOCKER_EVENTS = os.environ.get("USE_DOCKER_EVENTS", "true").lower() == "true"
+
+
+def inspect_containers(
+    docker: DockerClient, container_ids: List[str]
+) -> List[ContainerInspectResult]:
+    """
+    Returns the inspect results of the containers using a single
+    `docker container inspect` call
+
+    Arguments:
+        docker: Docker client used to run the command
+        container_ids: Container IDs to inspect
+    """
+    if not container_ids:
+        return []
+
+    output = run(docker.docker_cmd + ["container", "inspect"] + list(container_ids))
+    return [ContainerInspectResult.parse_obj(obj) for obj in json.loads(output)]
+
+
+def list_containers(
+    docker: DockerClient, filters: Dict[str, str]
+) -> List[ContainerInspectResult]:
+    """
+    Returns the inspect results of all containers (including stopped containers) that
+    match the filters using one `docker container list` and one
+    `docker container inspect` call
+
+    Arguments:
+        docker: Docker client used to run the commands
+        filters: `docker container list` filters (e.g. {"label": "foo=bar"})
+    """
+    full_cmd = docker.docker_cmd + [
+        "container",
+        "list",
+        "--all",
+        "--quiet",
+        "--no-trunc",
+    ]
+    full_cmd.add_args_list("--filter", format_dict_for_cli(filters))
+
+    try:
+        return inspect_containers(docker, run(full_cmd).splitlines())
+    except DockerException:
+        # containers may be removed between the list and inspect calls
+        log.debug("Retrying container snapshot", exc_info=True)
+        return inspect_containers(docker, run(full_cmd).splitlines())
+
+
+def list_project_containers(
+    docker: DockerClient, project_name: str
+) -> List[ContainerInspectResult]:
+    """
+    Returns the inspect results of all containers within the docker compose project
+
+    Arguments:
+        docker: Docker client used to run the commands
+        project_name: Docker compose project name
+    """
+    return list_containers(docker, {"label": f"{COMPOSE_PROJECT_LABEL}={project_name}"})
+
+
+def list_projects_containers(
+    docker: DockerClient, project_names: List[str]
+) -> Dict[str, List[ContainerInspectResult]]:
+    """
+    Returns the inspect results of the docker compose projects' containers keyed by
+    project name using one `docker container list` and one `docker container inspect`
+    call regardless of the number of projects. Only the containers of the projects
+    are inspected.
+
+    Arguments:
+        docker: Docker client used to run the commands
+        project_names: Docker compose project names
+    """
+    if len(project_names) == 1:
+        return {project_names[0]: list_project_containers(docker, project_names[0])}
+
+    full_cmd = docker.docker_cmd + [
+        "container",
+        "list",
+        "--all",
+        "--no-trunc",
+        "--format",
+        '{{.ID}} {{.Label "%s"}}' % COMPOSE_PROJECT_LABEL,
+    ]
+    full_cmd.add_args_list(
+        "--filter", format_dict_for_cli({"label": COMPOSE_PROJECT_LABEL})
+    )
+
+    def inspect_projects() -> List[ContainerInspectResult]:
+        container_ids = []
+        for line in run(full_cmd).splitlines():
+            container_id, _, project = line.partition(" ")
+            if project in projects:
+                container_ids.append(container_id)
+        return inspect_containers(docker, container_ids)
+
+    projects = {name: [] for name in project_names}
+    try:
+        containers = inspect_projects()
+    except DockerException:
+        # containers may be removed between the list and inspect calls
+        log.debug("Retrying container snapshot", exc_info=True)
+        containers = inspect_projects()
+
+    for c in containers:
+        projects[c.config.labels[COMPOSE_PROJECT_LABEL]].append(c)
+
+    return projects
+
+
+class DockerEventsWatcher:
+    """
+    Maintains an in-memory cache of the local ECS task containers by subscribing to
+    `docker events`. Containers are re-inspected once per lifecycle event so that
+    task attributes can be read from memory instead of running docker commands on
+    every request. The cache is resynced from docker whenever the event stream is
+    (re)connected.
+
+    Arguments:
+        docker: Docker client used to run the commands
+        project_prefix: Only containers of docker compose projects with this prefix are cached
+        retry_interval: Number of seconds to wait before reconnecting a dropped event stream
+    """
+
+    # container events that may change the container's inspect result
+    EVENT_ACTIONS = {
+        "create",
+        "start",
+        "restart",
+        "die",
+        "stop",
+        "kill",
+        "oom",
+        "pause",
+        "unpause",
+        "health_status",
+    }
+
+    def __init__(
+        self,
+        docker: DockerClient,
+        project_prefix: str,
+        retry_interval: float = 5,
+    ):
+        self.docker = docker
+        self.project_prefix = project_prefix
+        self.retry_interval = retry_interval
+        # project name -> container ID -> container inspect result
+        self.projects: Dict[str, Dict[str, ContainerInspectResult]] = {}
+        self.healthy = False
+        # callables that are called with the project name and containers when the
+        # project's cached containers change
+        self.listeners: List[Callable[[str, List[ContainerInspectResult]], None]] = []
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._process = None
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts watching docker events within a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="docker-events-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops watching docker events"""
+        self._stop.set()
+        self.healthy = False
+        if self._process:
+            self._process.terminate()
+
+    def add_listener(
+        self, listener: Callable[[str, List[ContainerInspectResult]], None]
+    ) -> None:
+        """
+        Adds a callable that is called with the project name and the project's
+        containers when the project's cached containers change
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, project_names: Iterable[str]) -> None:
+        for project in project_names:
+            with self._lock:
+                containers = list(self.projects.get(project, {}).values())
+            for listener in self.listeners:
+                try:
+                    listener(project, containers)
+                except Exception as err:
+                    log.debug(err, exc_info=True)
+
+    def project_containers(
+        self, project_name: str
+    ) -> Optional[List[ContainerInspectResult]]:
+        """
+        Returns the cached containers of the docker compose project or `None` if the
+        cache isn't in sync with docker
+        """
+        if not self.healthy:
+            return
+        with self._lock:
+            return list(self.projects.get(project_name, {}).values())
+
+    def update(self, containers: List[ContainerInspectResult]) -> None:
+        """Adds or replaces the containers within the cache"""
+        with self._lock:
+            for c in containers:
+                project = c.config.labels.get(COMPOSE_PROJECT_LABEL, "")
+                if project.startswith(self.project_prefix):
+                    self.projects.setdefault(project, {})[c.id] = c
+
+    def remove(self, container_id: str, project_name: str) -> None:
+        """Removes the container from the cache"""
+        with self._lock:
+            containers = self.projects.get(project_name, {})
+            containers.pop(container_id, None)
+            if not containers:
+                self.projects.pop(project_name, None)
+
+    def resync(self) -> None:
+        """Replaces the cache with the current state of all docker compose containers"""
+        containers = list_containers(self.docker, {"label": COMPOSE_PROJECT_LABEL})
+        with self._lock:
+            stale = set(self.projects)
+            self.projects = {}
+        self.update(containers)
+        self._notify(stale | set(self.projects))
+
+    def _handle(self, event: Dict[str, Any]) -> None:
+        """Updates the cache for the docker container event"""
+        action = event.get("Action", "").split(":")[0]
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        project = attributes.get(COMPOSE_PROJECT_LABEL, "")
+        container_id = event.get("Actor", {}).get("ID") or event.get("id")
+
+        if not project.startswith(self.project_prefix):
+            return
+        if action == "destroy":
+            self.remove(container_id, project)
+        elif action in self.EVENT_ACTIONS:
+            try:
+                self.update(inspect_containers(self.docker, [container_id]))
+            except DockerException:
+                # container was removed before it could be inspected
+                self.remove(container_id, project)
+        else:
+            return
+
+        self._notify([project])
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                # events that occur while resyncing are replayed from the stream
+                since = str(int(time.time()))
+                self.resync()
+
+                full_cmd = self.docker.docker_cmd + ["events", "--since", since]
+                full_cmd += ["--format", "{{json .}}"]
+                full_cmd.add_args_list(
+                    "--filter", ["type=container", f"label={COMPOSE_PROJECT_LABEL}"]
+                )
+                self._process = subprocess.Popen(
+                    [str(arg) for arg in full_cmd],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+                self.healthy = True
+                log.debug("Watching docker events")
+
+                for line in self._process.stdout:
+                    self._handle(json.loads(line))
+            except Exception as err:
+                log.error("Docker events watcher failed: %s", err)
+                log.debug(err, exc_info=True)
+            finally:
+                self.healthy = False
+                if self._process:
+                    self._process.kill()
+                    self._process.wait()
+
+            if not self._stop.is_set():
+                log.debug("Docker event stream stopped -- resyncing")
+                self._stop.wait(self.retry_interval)
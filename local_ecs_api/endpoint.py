@@ -0,0 +1,160 @@
+import ipaddress
+import logging
+import os
+import re
+import threading
+from typing import Optional
+
+from python_on_whales import DockerClient
+from python_on_whales.exceptions import DockerException
+from python_on_whales.utils import run
+
+from local_ecs_api.converters import (
+    ECS_ENDPOINT_IP,
+    ECS_NETWORK_SUBNET,
+    EXTERNAL_NETWORKS,
+)
+from local_ecs_api.docker_state import inspect_containers
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# number of seconds between ECS endpoint container health checks
+ECS_ENDPOINT_HEALTH_CHECK_INTERVAL = float(
+    os.environ.get("ECS_ENDPOINT_HEALTH_CHECK_INTERVAL", 30)
+)
+# compose service name of the ECS endpoint within docker-compose.local-endpoint.yml
+ECS_ENDPOINT_SERVICE = "ecs-local-endpoints"
+
+
+class EcsEndpointManager:
+    """
+    Manages the lifecycle of the local ECS endpoint container that vends AWS
+    credentials to the task containers. The endpoint's docker compose project is
+    brought up once and is only brought up again if the periodic health check
+    finds that the endpoint container isn't running.
+
+    Arguments:
+        health_check_interval: Number of seconds between endpoint container health checks
+    """
+
+    def __init__(self, health_check_interval: float):
+        self.health_check_interval = health_check_interval
+        self.docker = DockerClient(
+            compose_files=[
+                os.path.join(
+                    os.path.dirname(__file__), "docker-compose.local-endpoint.yml"
+                )
+            ]
+        )
+        if all(
+            [
+                os.environ.get("ECS_ENDPOINT_AWS_PROFILE"),
+                os.environ.get("ECS_AWS_CREDS_VOLUME_NAME"),
+            ]
+        ):
+            log.debug(
+                "Using AWS credentials volume mount override file for ECS endpoint"
+            )
+            # adds volume as an external volume in endpoint compose project
+            self.docker.client_config.compose_files.append(
+                os.path.join(
+                    os.path.dirname(__file__),
+                    "docker-compose.local-endpoint.aws_creds.yml",
+                )
+            )
+
+        self.healthy = False
+        self.container_name: Optional[str] = None
+        self.platform_family: Optional[str] = None
+
+        # serializes docker compose up calls on the endpoint project
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def up(self) -> None:
+        """Runs docker compose up for the ECS endpoint and connects the external networks"""
+        log.info("Running ECS endpoint service")
+        subnet = ipaddress.IPv4Network(ECS_NETWORK_SUBNET)
+        if ipaddress.IPv4Address(ECS_ENDPOINT_IP) not in subnet:
+            raise ValueError(
+                f"ECS_NETWORK_SUBNET: {subnet} must contain the ECS endpoint IP: {ECS_ENDPOINT_IP}"
+            )
+        run(
+            self.docker.docker_compose_cmd + ["up", "--detach"],
+            env={
+                "ECS_NETWORK_SUBNET": str(subnet),
+                "ECS_NETWORK_GATEWAY": str(subnet.network_address + 1),
+            },
+        )
+
+        if self.container_name is None:
+            self.container_name = (
+                self.docker.compose.config()
+                .services[ECS_ENDPOINT_SERVICE]
+                .container_name
+            )
+
+        log.debug("Adding custom external docker networks to ECS endpoint container")
+        for network in EXTERNAL_NETWORKS:
+            try:
+                self.docker.network.connect(network, self.container_name)
+            except DockerException as err:
+                if re.search(r"already exists in network", err.stderr):
+                    log.debug("Container is already associated")
+                else:
+                    raise err
+
+        container = inspect_containers(self.docker, [self.container_name])[0]
+        self.platform_family = container.platform.upper()
+        self.healthy = True
+
+    def ensure_up(self) -> None:
+        """Brings up the ECS endpoint if it isn't known to be running"""
+        if self.healthy:
+            return
+
+        with self._lock:
+            if not self.healthy:
+                self.up()
+
+    def check(self) -> bool:
+        """Returns True if the ECS endpoint container is running"""
+        if self.container_name is None:
+            return False
+        try:
+            container = inspect_containers(self.docker, [self.container_name])[0]
+        except DockerException:
+            return False
+
+        return bool(container.state.running)
+
+    def start(self) -> None:
+        """Brings up the ECS endpoint and health checks it within a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="ecs-endpoint", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops health checking the ECS endpoint"""
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self.healthy and not self.check():
+                log.warning("ECS endpoint container isn't running")
+                self.healthy = False
+
+            try:
+                self.ensure_up()
+            except Exception as err:
+                log.error("Failed to run ECS endpoint: %s", err)
+                log.debug(err, exc_info=True)
+
+            self._stop.wait(self.health_check_interval)
+
+
+ECS_ENDPOINT = EcsEndpointManager(ECS_ENDPOINT_HEALTH_CHECK_INTERVAL)
@@ -1,2 +1,10 @@
 class EcsAPIException(Exception):
     pass
+
+
+class InvalidParameterException(EcsAPIException):
+    """Raised for request parameters that are invalid (returned as a client error)"""
+
+
+class IPAddressCapacityException(EcsAPIException):
+    """Raised when there are no free IP addresses left for task containers"""
@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from python_on_whales import DockerClient
+from python_on_whales.exceptions import DockerException, NoSuchImage
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# pull the images of task definitions in the background once the task definition is
+# first retrieved so that RunTask launches don't wait for the full pull
+IMAGE_PREFETCH = os.environ.get("IMAGE_PREFETCH", "true").lower() == "true"
+# maximum number of images that are pulled concurrently in the background
+IMAGE_PREFETCH_MAX_WORKERS = int(os.environ.get("IMAGE_PREFETCH_MAX_WORKERS", 2))
+
+
+def task_definition_images(task_def: Dict[str, Any]) -> List[str]:
+    """Returns the unique container images of the ECS task definition"""
+    return list(
+        dict.fromkeys(
+            c["image"]
+            for c in task_def.get("containerDefinitions", [])
+            if c.get("image")
+        )
+    )
+
+
+class ImagePrefetcher:
+    """
+    Pulls images in the background with a bounded number of concurrent pulls.
+    Requests to prefetch an image that is already being pulled share the in-progress
+    pull and the IDs of images found on disk are cached so that each image is only
+    inspected or pulled once.
+
+    Arguments:
+        docker: Docker client used to inspect and pull the images
+        max_workers: Maximum number of concurrent pulls
+    """
+
+    def __init__(self, docker: DockerClient, max_workers: int):
+        self.docker = docker
+        # image reference -> ID of the image on disk
+        self.images: Dict[str, str] = {}
+        self._pulls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="image-prefetch"
+        )
+
+    def prefetch(self, images: List[str]) -> List[Future]:
+        """
+        Starts pulling the images that aren't known to be on disk and returns the
+        pulls of the images
+
+        Arguments:
+            images: Image references (e.g. `busybox:latest`)
+        """
+        futures = []
+        with self._lock:
+            for image in dict.fromkeys(images):
+                if image in self.images:
+                    continue
+                future = self._pulls.get(image)
+                if future is None:
+                    future = self._executor.submit(self._pull, image)
+                    self._pulls[image] = future
+                futures.append(future)
+
+        return futures
+
+    def wait(self, images: List[str]) -> None:
+        """
+        Waits for the in-progress pulls of the images. Pulls that are still queued
+        behind other images' pulls are cancelled so that the caller (e.g. docker
+        compose) pulls the images itself instead of waiting for the queue.
+        """
+        futures = []
+        with self._lock:
+            for image in images:
+                future = self._pulls.get(image)
+                if future is None:
+                    continue
+                # only futures that haven't started running can be cancelled
+                if future.cancel():
+                    log.debug("Cancelled queued image pull: %s", image)
+                    del self._pulls[image]
+                else:
+                    futures.append(future)
+        if futures:
+            log.debug("Waiting for %i image pulls", len(futures))
+            wait(futures)
+
+    def _pull(self, image: str) -> Optional[str]:
+        try:
+            try:
+                image_id = self.docker.image.inspect(image).id
+            except NoSuchImage:
+                log.info("Pulling image: %s", image)
+                image_id = self.docker.image.pull(image, quiet=True).id
+
+            with self._lock:
+                self.images[image] = image_id
+            return image_id
+        except DockerException as err:
+            # the pull is retried by docker compose when the task is launched
+            log.error("Failed to pull image: %s", image)
+            log.debug(err, exc_info=True)
+        finally:
+            with self._lock:
+                self._pulls.pop(image, None)
+
+
+IMAGE_PREFETCHER = ImagePrefetcher(DockerClient(), IMAGE_PREFETCH_MAX_WORKERS)
@@ -1,13 +1,19 @@
 import logging
-import os
 import sys
 
-import requests
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import JSONResponse
 
+from local_ecs_api.aws import CLIENT_POOL
+from local_ecs_api.docker_state import USE_DOCKER_EVENTS
+from local_ecs_api.endpoint import ECS_ENDPOINT
+from local_ecs_api.exceptions import EcsAPIException
 from local_ecs_api.models import (
+    DOCKER_EVENTS,
+    TASK_DEFINITION_CACHE_PREFETCH,
+    WARM_POOL_TASK_DEFINITIONS,
     DescribeTasksRequest,
     DescribeTasksResponse,
     ECSBackend,
@@ -16,6 +22,7 @@ from local_ecs_api.models import (
     RunTaskRequest,
     RunTaskResponse,
 )
+from local_ecs_api.proxy import ECS_PROXY
 
 log = logging.getLogger("local-ecs-api")
 log.setLevel(logging.DEBUG)
@@ -28,21 +35,117 @@ app = FastAPI()
 backend = ECSBackend()
 
 
+@app.on_event("startup")
+async def start_ecs_endpoint():
+    """Brings up the ECS endpoint that vends credentials to the task containers"""
+    ECS_ENDPOINT.start()
+
+
+@app.on_event("shutdown")
+async def stop_ecs_endpoint():
+    """Stops health checking the ECS endpoint"""
+    ECS_ENDPOINT.stop()
+
+
+@app.on_event("startup")
+async def start_ecs_proxy():
+    """Creates the HTTP client used to forward unsupported ECS API requests"""
+    await ECS_PROXY.start()
+
+
+@app.on_event("shutdown")
+async def stop_ecs_proxy():
+    """Closes the HTTP client used to forward unsupported ECS API requests"""
+    await ECS_PROXY.stop()
+
+
+@app.on_event("startup")
+async def warm_aws_clients():
+    """Creates the pooled AWS clients before the first RunTask request"""
+    await run_in_threadpool(CLIENT_POOL.warm)
+
+
+@app.on_event("startup")
+async def reconcile_tasks():
+    """Adds the tasks launched before the API was started to the task store"""
+    try:
+        await run_in_threadpool(backend.reconcile_tasks)
+    except Exception as err:
+        log.error("Failed to reconcile tasks: %s", err)
+        log.debug(err, exc_info=True)
+
+
+@app.on_event("startup")
+async def prefetch_task_definitions():
+    """Caches the task definitions specified within TASK_DEFINITION_CACHE_PREFETCH"""
+    if TASK_DEFINITION_CACHE_PREFETCH:
+        backend.executor.submit(
+            backend.prefetch_task_definitions, TASK_DEFINITION_CACHE_PREFETCH
+        )
+
+
+@app.on_event("startup")
+async def start_warm_pool():
+    """Starts creating the tasks of the WARM_POOL_TASK_DEFINITIONS task definitions"""
+    if WARM_POOL_TASK_DEFINITIONS:
+        backend.warm_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_warm_pool():
+    """Removes the unclaimed tasks of the warm pool"""
+    if WARM_POOL_TASK_DEFINITIONS:
+        await run_in_threadpool(backend.warm_pool.stop)
+
+
+@app.on_event("startup")
+async def start_docker_events():
+    """Starts caching the task containers' state from docker events"""
+    if USE_DOCKER_EVENTS:
+        DOCKER_EVENTS.start()
+
+
+@app.on_event("shutdown")
+async def stop_docker_events():
+    """Stops the docker events watcher"""
+    DOCKER_EVENTS.stop()
+
+
+@app.exception_handler(EcsAPIException)
+async def ecs_api_exception_handler(request: Request, exc: EcsAPIException):
+    """Returns the exception as an AWS JSON protocol client error"""
+    return JSONResponse(
+        status_code=400,
+        content={"__type": type(exc).__name__, "message": str(exc)},
+    )
+
+
 @app.middleware("http")
 async def add_resource_path(request: Request, call_next):
     """Parses the endpoint path from the request header and replaces the original resource path"""
-    request.scope["path"] = "/" + request.headers.get("x-amz-target", "").split(".")[-1]
+    # requests without the header (e.g. the proxy cache stats) keep their original path
+    if "x-amz-target" in request.headers:
+        request.scope["path"] = "/" + request.headers["x-amz-target"].split(".")[-1]
     response = await call_next(request)
     return response
 
 
+@app.get("/proxy/cache/stats")
+async def proxy_cache_stats() -> dict:
+    """Returns the hit, miss and invalidation counters of the proxied ECS response cache"""
+    if ECS_PROXY.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ECS_PROXY.cache.stats()}
+
+
 @app.post("/ListTasks", response_model=ListTasksResponse)
 async def list_tasks(request: Request) -> ListTasksResponse:
     """Retreives the local docker task ARNs that meet the request filters"""
     request_json = await request.json()
     request = ListTasksRequest(**request_json)
 
-    arns = backend.list_tasks(
+    arns, next_token = await run_in_threadpool(
+        backend.list_tasks,
         cluster=request.cluster,
         family=request.family,
         launch_type=request.launchType,
@@ -51,8 +154,9 @@ async def list_tasks(request: Request) -> ListTasksResponse:
         started_by=request.startedBy,
         container_instance=request.containerInstance,
         max_results=request.maxResults,
+        next_token=request.nextToken,
     )
-    return ListTasksResponse(taskArns=arns)
+    return ListTasksResponse(taskArns=arns, nextToken=next_token)
 
 
 @app.post("/DescribeTasks", response_model=DescribeTasksResponse)
@@ -61,7 +165,9 @@ async def describe_tasks(request: Request) -> DescribeTasksResponse:
     request_json = await request.json()
     request = DescribeTasksRequest(**request_json)
 
-    output = backend.describe_tasks(tasks=request.tasks, include=request.include)
+    output = await run_in_threadpool(
+        backend.describe_tasks, tasks=request.tasks, include=request.include
+    )
     return DescribeTasksResponse(**output)
 
 
@@ -71,43 +177,18 @@ async def run_task(request: Request) -> RunTaskResponse:
     request_json = await request.json()
     request = RunTaskRequest(**request_json)
 
-    output = backend.run_task(**request.dict(exclude_none=True))
+    output = await run_in_threadpool(
+        backend.run_task, **request.dict(exclude_none=True)
+    )
     return RunTaskResponse(**output)
 
 
 @app.post("/{full_path:path}")
 async def redirect(request: Request, full_path: str):
     """Redirect request to endpoint specified witin ECS_ENDPOINT_URL environment variable"""
-    redirect_url = os.environ.get("ECS_ENDPOINT_URL", "https://ecs.amazonaws.com")
-    log.info("Redirecting path: %s to: %s", request.scope["path"], redirect_url)
-
-    # AWS service APIs require resource path to be "/"
-    request.scope["path"] = "/"
-    data = await request.json()
-
-    if request.method == "POST":
-        response = requests.post(
-            os.environ.get("ECS_ENDPOINT_URL", "https://ecs.amazonaws.com"),
-            headers=dict(request.headers.items()),
-            json=data,
-            timeout=10,
-        )
-
-    elif request.method == "GET":
-        response = requests.get(
-            os.environ.get("ECS_ENDPOINT_URL", "https://ecs.amazonaws.com"),
-            headers=dict(request.headers.items()),
-            json=data,
-            timeout=10,
-        )
+    log.info("Redirecting path: %s to: %s", request.scope["path"], ECS_PROXY.url)
 
-    # translates requests.models.Response to starlette.responses.Response
-    return Response(
-        status_code=response.status_code,
-        content=response.content,
-        headers=response.headers,
-        media_type=response.headers["Content-Type"],
-    )
+    return await ECS_PROXY.forward(request)
 
 
 if __name__ == "__main__":
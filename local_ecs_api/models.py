@@ -1,22 +1,98 @@
+import copy
 import json
 import logging
 import os
 import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import cached_property
-from typing import Any, Dict, List, Optional
+from glob import glob
+from typing import Any, Dict, List, Optional, Tuple
 
-import boto3
 from pydantic import BaseModel
+from python_on_whales import DockerClient
+from python_on_whales.components.container.models import ContainerInspectResult
 from python_on_whales.exceptions import DockerException
-from python_on_whales.utils import run
 
-from local_ecs_api.converters import DockerTask
+from local_ecs_api.aws import CLIENT_POOL
+from local_ecs_api.cache import TTLCache
+from local_ecs_api.converters import (
+    COMPOSE_DEST,
+    DOCKER_PROJECT_PREFIX,
+    ECS_NETWORK_IPS,
+    DockerTask,
+)
+from local_ecs_api.docker_state import (
+    COMPOSE_PROJECT_LABEL,
+    COMPOSE_SERVICE_LABEL,
+    COMPOSE_WORKING_DIR_LABEL,
+    USE_DOCKER_EVENTS,
+    WARM_TASK_LABEL,
+    DockerEventsWatcher,
+    list_containers,
+    list_project_containers,
+    list_projects_containers,
+)
+from local_ecs_api.endpoint import ECS_ENDPOINT
+from local_ecs_api.exceptions import InvalidParameterException
+from local_ecs_api.images import (
+    IMAGE_PREFETCH,
+    IMAGE_PREFETCHER,
+    task_definition_images,
+)
+from local_ecs_api.pool import (
+    WARM_POOL_MAX_AGE,
+    WARM_POOL_SIZE,
+    WARM_POOL_TASK_DEFINITIONS,
+    WarmTaskPool,
+)
+from local_ecs_api.store import (
+    LIST_TASKS_MAX_RESULTS,
+    SQLiteDatabase,
+    SQLiteIPLeases,
+    SQLiteTaskStore,
+    TaskStore,
+)
 
 log = logging.getLogger("local-ecs-api")
 log.setLevel(logging.DEBUG)
 
+# maximum number of RunTask launches that can be processed concurrently
+RUN_TASK_MAX_WORKERS = int(os.environ.get("RUN_TASK_MAX_WORKERS", 4))
+# maximum number of DescribeTaskDefinition responses to cache
+TASK_DEFINITION_CACHE_SIZE = int(os.environ.get("TASK_DEFINITION_CACHE_SIZE", 256))
+# number of seconds a task definition referenced by family only (latest revision) is cached
+TASK_DEFINITION_FAMILY_CACHE_TTL = float(
+    os.environ.get("TASK_DEFINITION_FAMILY_CACHE_TTL", 5)
+)
+# number of seconds a task definition referenced by revision is cached before it's
+# retrieved again (revisions are re-registered when the ECS endpoint is reset)
+TASK_DEFINITION_REVISION_CACHE_TTL = float(
+    os.environ.get("TASK_DEFINITION_REVISION_CACHE_TTL", 300)
+)
+# maximum number of tasks a single RunTask request can launch
+RUN_TASK_MAX_COUNT = 10
+# maximum number of stopped tasks kept for DescribeTasks/ListTasks
+STOPPED_TASK_RETENTION_COUNT = int(os.environ.get("STOPPED_TASK_RETENTION_COUNT", 1000))
+# number of seconds stopped tasks are kept for DescribeTasks/ListTasks
+STOPPED_TASK_RETENTION_SECONDS = float(
+    os.environ.get("STOPPED_TASK_RETENTION_SECONDS", 3600)
+)
+# path to the SQLite database tasks are persisted within so that tasks survive restarts
+# and are shared by multiple API worker processes (tasks are kept in memory if unset)
+TASK_STORE_PATH = os.environ.get("TASK_STORE_PATH")
+# name of the file within the task's compose directory the task record is written to
+TASK_RECORD_FILENAME = "task.json"
+# task definition families to cache on startup
+TASK_DEFINITION_CACHE_PREFETCH = [
+    family
+    for family in os.environ.get("TASK_DEFINITION_CACHE_PREFETCH", "").split(",")
+    if family != ""
+]
+
+DOCKER_EVENTS = DockerEventsWatcher(DockerClient(), DOCKER_PROJECT_PREFIX)
+
 
 class CapacityProviderStrategy(BaseModel):
     base: int
@@ -122,7 +198,7 @@ class RunTaskRequest(BaseModel):
 
 class Failures(BaseModel):
     arn: str
-    detail: str
+    detail: Optional[str]
     reason: str
 
 
@@ -263,18 +339,14 @@ class RunTaskBackend(DockerTask):
     ECS compatible response attributes
     """
 
-    def __init__(self, task_def: str, **kwargs):
-        DockerTask.__init__(self, task_def)
-        self.request = kwargs
+    def __init__(self, task_def: str, task_id: Optional[str] = None, **kwargs):
+        DockerTask.__init__(self, task_def, task_id)
         self.metadata = {}
-        if self.request.get("propagateTags") == "TASK_DEFINITION":
-            # TODO: raise approriate botocore exception for when propagateTags == "SERVICE"
-            self.request["tags"] += self.task_def["tags"]
 
         aws_attr = self._parse_arn(self.task_def_arn)
         self.region = aws_attr["region"]
         self.account_id = aws_attr["account_id"]
-        self.cluster_arn = f"arn:aws:ecs:{self.region}:{self.account_id}:cluster/{self.request['cluster']}"
+        self.assign_request(kwargs)
 
         self.essential_containers = [
             c["name"]
@@ -283,35 +355,241 @@ class RunTaskBackend(DockerTask):
         ]
         self.task_arn = f"arn:aws:ecs:{self.region}:{self.account_id}:task/{self.id}"
 
-        self.started_at = datetime.timestamp(datetime.now())
-        self.created_at = None
+        self.created_at = datetime.timestamp(datetime.now())
+        self.started_at = None
+        self.pull_started_at = None
+        self.pull_stopped_at = None
         self.stopping_at = None
         self.stopped_at = None
-        self.stopping_at = None
         self._execution_stopped_at = None
-        self._last_status = None
+        # tasks are registered before any of the docker resources are created
+        self._last_status = "PROVISIONING"
+        # True once `docker compose up` has been run for the task's compose project
+        self.launched = False
 
         self.run_exception = None
+        self._snapshot = None
 
-    @cached_property
+    def assign_request(self, request: Dict[str, Any]) -> None:
+        """
+        Associates the RunTask request with the task
+
+        Arguments:
+            request: RunTask request
+        """
+        self.request = request
+        if self.request.get("propagateTags") == "TASK_DEFINITION":
+            # TODO: raise approriate botocore exception for when propagateTags == "SERVICE"
+            self.request["tags"] += self.task_def["tags"]
+
+        self.cluster_arn = f"arn:aws:ecs:{self.region}:{self.account_id}:cluster/{self.request['cluster']}"
+
+    def prepare(self, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        Creates the task's docker compose project without starting the task's
+        containers so that launching the task only starts the containers
+
+        Arguments:
+            labels: Docker labels to add to the task's containers
+        """
+        ECS_ENDPOINT.ensure_up()
+        self.create(labels=labels)
+        self.up(start=False)
+
+    @property
+    def prepared(self) -> bool:
+        """Returns True if the task's containers are created but not started"""
+        return self.created_env is not None
+
+    def launch(self, overrides=None) -> None:
+        """
+        Creates and runs the task's docker compose project while transitioning the
+        task through the PROVISIONING -> PENDING -> RUNNING lifecycle states. Any error
+        raised while launching the task is recorded and the task is transitioned
+        to STOPPED. Tasks created via `prepare()` only start their containers.
+
+        Arguments:
+            overrides: ECS task and container overrides
+        """
+        try:
+            ECS_ENDPOINT.ensure_up()
+            prepared = self.prepared
+            if not prepared:
+                self.create(overrides)
+            # allows the task to be reconciled if the API restarts while launching
+            self.write_record()
+
+            self.last_status = "PENDING"
+            self.launched = True
+            self.pull_started_at = datetime.timestamp(datetime.now())
+            if prepared:
+                self.start()
+            else:
+                self.up(overrides)
+            if USE_DOCKER_EVENTS:
+                # ensures the containers are cached before their events are processed
+                DOCKER_EVENTS.update(self._list_containers())
+            self.pull_stopped_at = datetime.timestamp(datetime.now())
+            self.started_at = self.pull_stopped_at
+
+            # subsequent lifecycle states are derived from the docker compose project
+            self.last_status = None
+        except Exception as err:
+            if isinstance(err, DockerException):
+                log.debug(
+                    "Exit code: %i while running: %s",
+                    err.return_code,
+                    err.docker_command,
+                )
+            log.error(err, exc_info=True)
+
+            self.run_exception = err
+            self.stopping_at = datetime.timestamp(datetime.now())
+            self.stopped_at = self.stopping_at
+            self.execution_stopped_at = self.stopping_at
+            self.last_status = "STOPPED"
+
+        self.write_record()
+
+    def to_record(self) -> Dict[str, Any]:
+        """
+        Returns the task's JSON serializable state that isn't derived from the task's
+        docker compose project
+        """
+        return {
+            "id": self.id,
+            "task_def": {"taskDefinition": self.task_def},
+            "request": self.request,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "pull_started_at": self.pull_started_at,
+            "pull_stopped_at": self.pull_stopped_at,
+            "stopping_at": self.stopping_at,
+            "stopped_at": self.stopped_at,
+            "execution_stopped_at": self._execution_stopped_at,
+            "last_status": self._last_status,
+            "launched": self.launched,
+            "stop_code": self.stop_code,
+            "stopped_reason": self.stopped_reason,
+        }
+
+    @property
+    def record_filepath(self) -> str:
+        """Returns the path of the task record within the task's compose directory"""
+        return os.path.join(self.compose_dir, TASK_RECORD_FILENAME)
+
+    def write_record(self) -> None:
+        """Writes the task record to the task's compose directory if it exists"""
+        if not os.path.isdir(self.compose_dir):
+            return
+
+        tmp_path = self.record_filepath + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.to_record(), f, default=str)
+            os.replace(tmp_path, self.record_filepath)
+        except OSError as err:
+            log.error("Failed to write task record: %s", self.record_filepath)
+            log.debug(err, exc_info=True)
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "RunTaskBackend":
+        """
+        Returns the task for the record returned by `to_record()`
+
+        Arguments:
+            record: Task record
+        """
+        # tags were already propagated when the task was created
+        request = {
+            key: value
+            for key, value in record["request"].items()
+            if key != "propagateTags"
+        }
+        task = cls(record["task_def"], task_id=record["id"], **request)
+        task.request = record["request"]
+
+        for attr in [
+            "created_at",
+            "started_at",
+            "pull_started_at",
+            "pull_stopped_at",
+            "stopping_at",
+            "stopped_at",
+            "launched",
+        ]:
+            setattr(task, attr, record[attr])
+        task._execution_stopped_at = record["execution_stopped_at"]
+        task._last_status = record["last_status"]
+
+        if record["stop_code"] is not None:
+            task.run_exception = DockerException(
+                [],
+                record["stop_code"],
+                stderr=(record["stopped_reason"] or "").encode(),
+            )
+        elif record["stopped_reason"]:
+            task.run_exception = Exception(record["stopped_reason"])
+
+        return task
+
+    @property
+    def desired_status(self) -> str:
+        """Returns the task's desired status derived from the task's last status"""
+        return "STOPPED" if self.last_status == "STOPPED" else "RUNNING"
+
+    @property
     def platform_family(self):
         # use ecs endpoint to determine platformFamily in case
         # main docker project were to fail
-        return self.docker_ecs_endpoint.compose.ps()[0].platform.upper()
+        return ECS_ENDPOINT.platform_family
 
-    @cached_property
+    def _list_containers(self) -> List[ContainerInspectResult]:
+        return list_project_containers(
+            self.docker, self.docker.client_config.compose_project_name
+        )
+
+    def refresh(self) -> None:
+        """
+        Takes a snapshot of the task's docker compose project containers that the
+        docker-derived task attributes are read from. The snapshot is read from the
+        docker events cache if it's in sync with docker and from docker otherwise.
+        """
+        containers = None
+        if USE_DOCKER_EVENTS:
+            containers = DOCKER_EVENTS.project_containers(
+                self.docker.client_config.compose_project_name
+            )
+        self.snapshot = (
+            containers if containers is not None else self._list_containers()
+        )
+
+    @property
+    def snapshot(self) -> List[ContainerInspectResult]:
+        """Returns the last snapshot of the task's containers (taken on first access)"""
+        if not self.launched:
+            return []
+        if self._snapshot is None:
+            self.refresh()
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, value: List[ContainerInspectResult]):
+        self._snapshot = value
+
+    @property
     def attachments(self) -> List[Attachments]:
         """
         Returns list of docker compose project attributes translated to the ECS
         response attachment attribute
         """
         attachments = []
-        for c_id in self.docker.compose.ps():
-            inspect = self.docker.container.inspect(c_id)
-            for name, network in inspect.network_settings.networks.items():
+        for c in self.snapshot:
+            for name, network in c.network_settings.networks.items():
                 attachments.append(
                     Attachments(
-                        id=str(uuid.uuid4()),
+                        # deterministic ID so that the ID is consistent across snapshots
+                        id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{c.id}/{name}")),
                         type="ElasticNetworkInterface",
                         status="ATTACHED",
                         defails=[
@@ -329,7 +607,7 @@ class RunTaskBackend(DockerTask):
     @property
     def service_names(self) -> List[str]:
         """Returns list of docker service names associated with ECS task defintition"""
-        return [c.name for c in self.docker.compose.ps()]
+        return [c.name.removeprefix("/") for c in self.snapshot]
 
     @property
     def last_status(self) -> str:
@@ -337,29 +615,14 @@ class RunTaskBackend(DockerTask):
         if self._last_status:
             return self._last_status
 
-        ##
-        full_cmd = self.docker.docker_compose_cmd + [
-            "ls",
-            "--format",
-            "json",
-            "--all",
-        ]
-        for proj in json.loads(run(full_cmd)):
-            if proj["Name"] == self.docker.compose.client_config.compose_project_name:
-                statuses = re.sub(r"\([0-9]+\)", "", proj["Status"]).split(", ")
-                if "running" in statuses:
-                    return "RUNNING"
-                if "exited" in statuses:
-                    return "STOPPED"
-        ##
-
-        # replace above ## section with below once PR is merged and within release: https://github.com/gabrieldemarmiesse/python-on-whales/pull/377
-        # for proj in self.docker.compose.ls(all=True):
-        #     if proj.name == self.docker.compose.client_config.compose_project_name:
-        #         if proj.running:
-        #             return "RUNNING"
-        #         if proj.exited:
-        #             return "STOPPED"
+        statuses = {c.state.status for c in self.snapshot}
+        if statuses & {"running", "restarting", "paused"}:
+            return "RUNNING"
+        if statuses & {"exited", "dead"}:
+            return "STOPPED"
+        if statuses:
+            # containers are created but not yet started
+            return "PENDING"
 
     @last_status.setter
     def last_status(self, value):
@@ -368,35 +631,37 @@ class RunTaskBackend(DockerTask):
     @property
     def task_health_status(self) -> str:
         """
-        Returns the health status of first container that reports a status other
-        than "healthy" or returns a health status of "healthy" if all containers
-        have a health status of "healthy"
+        Returns the health status of first essential container that reports a status other
+        than "HEALTHY" or returns a health status of "HEALTHY" if all essential containers
+        have a health status of "HEALTHY"
         """
-        for c in self.docker.compose.ps():
-            if c.name in self.essential_containers:
-                status = getattr(c.state, "health", "UKNOWN")
-                if status == "healthy":
-                    continue
+        essential = [
+            c
+            for c in self.snapshot
+            if c.config.labels.get(COMPOSE_SERVICE_LABEL) in self.essential_containers
+        ]
+        for c in essential:
+            status = c.state.health.status if c.state.health else None
+            if status == "healthy":
+                continue
 
-                return status
+            return (status or "UNKNOWN").upper()
 
-        return "UNKNOWN"
+        return "HEALTHY" if essential else "UNKNOWN"
 
     @property
     def execution_stopped_at(self) -> int:
         """
         Returns the timestamp of when all containers within the compose project have finished
-        or returns `0` if any containers are still running
+        or returns `None` if any containers are still running
         """
         if self._execution_stopped_at:
             return self._execution_stopped_at
 
-        finished_ts = [
-            datetime.timestamp(c.state.finished_at) for c in self.docker.compose.ps()
-        ]
+        finished_ts = [datetime.timestamp(c.state.finished_at) for c in self.snapshot]
 
         # containers that are still running return a negative timestamp
-        if min(finished_ts) < 0:
+        if not finished_ts or min(finished_ts) < 0:
             return
 
         return max(finished_ts)
@@ -421,8 +686,7 @@ class RunTaskBackend(DockerTask):
         """
         response = []
 
-        for c_id in self.docker.compose.ps():
-            c = self.docker.container.inspect(c_id)
+        for c in self.snapshot:
             response.append(
                 Containers(
                     containerArn=f"arn:aws:ecs:{self.region}:{self.account_id}:container/{c.id}",
@@ -437,7 +701,7 @@ class RunTaskBackend(DockerTask):
                     managedAgents=[],
                     memory=c.host_config.memory,
                     memoryReservation=c.host_config.memory_reservation,
-                    name=c.name,
+                    name=c.name.removeprefix("/"),
                     # TODO replace empty list with docker mapping
                     networkBindings=[],
                     # TODO replace empty list with docker mapping
@@ -463,29 +727,362 @@ class RunTaskBackend(DockerTask):
 
     def is_failure(self) -> bool:
         """Returns True if task contains any containers that have failed and False otherwise"""
-        for c_id in self.docker.compose.ps():
-            if self.docker.container.inspect(c_id).state.exit_code != 0:
-                return True
-
-        return False
+        return any(c.state.exit_code != 0 for c in self.snapshot)
 
     @property
     def stop_code(self) -> int:
         """Returns the exit code from running the `docker compose up` command"""
         # TODO: possibly translate local docker exit cases to ECS stop codes
-        if self.run_exception:
+        if isinstance(self.run_exception, DockerException):
             return self.run_exception.return_code
 
     @property
     def stopped_reason(self) -> str:
-        """Returns the stderr from running the `docker compose up` command"""
-        if self.run_exception:
+        """
+        Returns the stderr from running the `docker compose up` command or the error
+        message of any other error raised while launching the task
+        """
+        if isinstance(self.run_exception, DockerException):
             return self.run_exception.stderr
+        if self.run_exception:
+            return str(self.run_exception)
 
 
 class ECSBackend:
     def __init__(self):
-        self.tasks = {}
+        # thread-safe given RunTask launches are processed within the executor's
+        # worker threads while DescribeTasks/ListTasks requests read from it.
+        # stopped tasks are evicted similar to ECS only showing recently stopped tasks
+        index_keys = {
+            "cluster": lambda task: self._cluster_name(task.request["cluster"]),
+            "family": lambda task: task.task_def["family"],
+            "launchType": lambda task: task.request.get("launchType"),
+            "startedBy": lambda task: task.request.get("startedBy"),
+            "containerInstance": lambda task: task.request.get("containerInstance"),
+            "desiredStatus": lambda task: task.desired_status,
+        }
+        retention = {
+            "is_stopped": lambda task: task.desired_status == "STOPPED",
+            "max_stopped": STOPPED_TASK_RETENTION_COUNT,
+            "stopped_ttl": STOPPED_TASK_RETENTION_SECONDS,
+        }
+        if TASK_STORE_PATH:
+            log.info("Persisting tasks within: %s", TASK_STORE_PATH)
+            db = SQLiteDatabase(TASK_STORE_PATH)
+            self.tasks = SQLiteTaskStore(
+                db,
+                index_keys,
+                load=RunTaskBackend.from_record,
+                status_key=lambda task: task.last_status,
+                **retention,
+            )
+            # task IPs are leased within the database so that worker processes
+            # don't allocate the same IPs
+            ECS_NETWORK_IPS.leases = SQLiteIPLeases(db)
+        else:
+            self.tasks = TaskStore(index_keys, **retention)
+        self.executor = ThreadPoolExecutor(
+            max_workers=RUN_TASK_MAX_WORKERS, thread_name_prefix="run-task"
+        )
+        self.task_definitions = TTLCache(maxsize=TASK_DEFINITION_CACHE_SIZE)
+        # used for docker queries that span multiple task compose projects
+        self.docker = DockerClient()
+        DOCKER_EVENTS.add_listener(self._on_project_event)
+        self.warm_pool = WarmTaskPool(
+            WARM_POOL_TASK_DEFINITIONS,
+            WARM_POOL_SIZE,
+            WARM_POOL_MAX_AGE,
+            describe=self.describe_task_definition,
+            create=self._create_warm_task,
+            remove=lambda task: task.down(),
+        )
+
+    @staticmethod
+    def _cluster_name(cluster: str) -> str:
+        """Returns the cluster name of the cluster name or ARN"""
+        return cluster.split("cluster/")[-1]
+
+    def _on_project_event(
+        self, project_name: str, containers: List[ContainerInspectResult]
+    ) -> None:
+        """Updates the task's status index for the docker events of the task's project"""
+        try:
+            task = self.get_task(project_name.removeprefix(DOCKER_PROJECT_PREFIX))
+        except KeyError:
+            return
+
+        if task.launched:
+            task.snapshot = containers
+            self.update_task(task)
+
+    @staticmethod
+    def _task_definition_key(task_definition: str) -> str:
+        """
+        Returns the `family` or `family:revision` cache key for the task definition
+        family, family:revision or ARN
+        """
+        return task_definition.split("task-definition/")[-1]
+
+    def describe_task_definition(self, task_definition: str) -> Dict[str, Any]:
+        """
+        Returns the DescribeTaskDefinition response for the task definition. Revisioned
+        task definitions are cached for TASK_DEFINITION_REVISION_CACHE_TTL seconds given
+        the revision is registered again if the ECS endpoint (e.g. moto or LocalStack)
+        is reset while references to the family's latest revision are cached for
+        TASK_DEFINITION_FAMILY_CACHE_TTL seconds.
+
+        Arguments:
+            task_definition: Task definition family, family:revision or ARN
+        """
+        key = self._task_definition_key(task_definition)
+        task_def = self.task_definitions.get(key)
+        if task_def is None:
+            # use base AWS creds for getting task def
+            # so that the task execution role doesn't need extra permissions
+            task_def = CLIENT_POOL.client("ecs").describe_task_definition(
+                taskDefinition=task_definition
+            )
+            task_def.pop("ResponseMetadata", None)
+
+            revision_key = "{family}:{revision}".format(**task_def["taskDefinition"])
+            if IMAGE_PREFETCH and revision_key not in self.task_definitions:
+                # starts pulling the images of newly seen revisions while the task is
+                # being created
+                IMAGE_PREFETCHER.prefetch(
+                    task_definition_images(task_def["taskDefinition"])
+                )
+            self.task_definitions.set(
+                revision_key, task_def, ttl=TASK_DEFINITION_REVISION_CACHE_TTL
+            )
+            if key != revision_key:
+                self.task_definitions.set(
+                    key, task_def, ttl=TASK_DEFINITION_FAMILY_CACHE_TTL
+                )
+        else:
+            log.debug("Using cached task definition: %s", key)
+
+        # tasks may modify their task definition so a copy is returned
+        return copy.deepcopy(task_def)
+
+    def prefetch_task_definitions(self, families: List[str]) -> None:
+        """
+        Caches the latest revision of the task definition families
+
+        Arguments:
+            families: Task definition families
+        """
+        for family in families:
+            try:
+                self.describe_task_definition(family)
+            except Exception as err:
+                log.error("Failed to prefetch task definition: %s", family)
+                log.debug(err, exc_info=True)
+
+    @staticmethod
+    def _create_warm_task(task_def: Dict[str, Any]) -> RunTaskBackend:
+        """Returns a task whose containers are created but not started for the warm pool"""
+        # the RunTask request is assigned once the task is claimed
+        task = RunTaskBackend(
+            task_def,
+            cluster="default",
+            taskDefinition=task_def["taskDefinition"]["taskDefinitionArn"],
+        )
+        try:
+            # labels the task's containers so that the task can be removed by the
+            # reconciliation if the API process exits without removing the task
+            task.prepare(labels={WARM_TASK_LABEL: str(os.getpid())})
+        except Exception:
+            try:
+                task.down()
+            except Exception as err:
+                log.debug(err, exc_info=True)
+            raise
+
+        return task
+
+    def add_task(self, task: RunTaskBackend) -> None:
+        """Adds the task to the task store"""
+        self.tasks.add(task)
+
+    def get_task(self, task_id: str) -> RunTaskBackend:
+        """Returns the task associated with the task ID from the task store"""
+        return self.tasks.get(task_id)
+
+    def update_task(self, task: RunTaskBackend) -> None:
+        """
+        Updates the task store's indexes for the task's current status and releases
+        the task's IP addresses once the task is stopped
+        """
+        self.tasks.reindex(task)
+        if task.desired_status == "STOPPED":
+            ECS_NETWORK_IPS.release(task.id)
+
+    @staticmethod
+    def _read_task_record(
+        task_id: str, containers: List[ContainerInspectResult]
+    ) -> Dict[str, Any]:
+        """
+        Returns the task record written to the compose directory of the task's
+        docker compose project
+
+        Arguments:
+            task_id: Task ID
+            containers: Containers of the task's docker compose project
+        """
+        compose_dirs = [
+            c.config.labels[COMPOSE_WORKING_DIR_LABEL]
+            for c in containers
+            if COMPOSE_WORKING_DIR_LABEL in c.config.labels
+        ]
+        # compose directories are named after the task definition and task ID
+        compose_dirs += glob(os.path.join(COMPOSE_DEST, f".*-{task_id[:4]}"))
+
+        for compose_dir in dict.fromkeys(compose_dirs):
+            try:
+                with open(os.path.join(compose_dir, TASK_RECORD_FILENAME)) as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                continue
+            if record["id"] == task_id:
+                return record
+
+        raise FileNotFoundError(f"Task record not found for task: {task_id}")
+
+    @staticmethod
+    def _is_orphaned_warm_task(containers: List[ContainerInspectResult]) -> bool:
+        """
+        Returns True if the containers belong to an unclaimed warm pool task of an API
+        process that is no longer running. Tasks of this process are orphaned given
+        tasks are reconciled before this process's warm pool is started.
+
+        Arguments:
+            containers: Containers of the task's docker compose project
+        """
+        pids = {
+            c.config.labels[WARM_TASK_LABEL]
+            for c in containers
+            if WARM_TASK_LABEL in c.config.labels
+        }
+        for pid in pids:
+            if int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                continue
+            except PermissionError:
+                pass
+            # the warm task belongs to another running API worker process
+            return False
+
+        return bool(pids)
+
+    def _remove_project(self, project: str) -> None:
+        """Removes the docker compose project and releases the task's IPs"""
+        log.info("Removing orphaned warm task project: %s", project)
+        try:
+            DockerClient(compose_project_name=project).compose.down()
+        except DockerException as err:
+            log.error("Failed to remove orphaned warm task project: %s", project)
+            log.debug(err, exc_info=True)
+        ECS_NETWORK_IPS.release(project.removeprefix(DOCKER_PROJECT_PREFIX))
+
+    def reconcile_tasks(self) -> None:
+        """
+        Adds the tasks of the local docker compose projects that aren't within the task
+        store (e.g. tasks launched before the API was restarted). Tasks are rebuilt from
+        the task record within the task's compose directory and the projects are found
+        using one docker query. Tasks stopped for longer than
+        STOPPED_TASK_RETENTION_SECONDS are skipped and unclaimed warm pool tasks of API
+        processes that are no longer running are removed.
+        """
+        projects = {}
+        for c in list_containers(self.docker, {"label": COMPOSE_PROJECT_LABEL}):
+            project = c.config.labels.get(COMPOSE_PROJECT_LABEL, "")
+            if project.startswith(DOCKER_PROJECT_PREFIX):
+                projects.setdefault(project, []).append(c)
+
+        tasks = []
+        for project, containers in projects.items():
+            task_id = project.removeprefix(DOCKER_PROJECT_PREFIX)
+            try:
+                self.get_task(task_id)
+                continue
+            except KeyError:
+                pass
+
+            try:
+                task = RunTaskBackend.from_record(
+                    self._read_task_record(task_id, containers)
+                )
+            except FileNotFoundError as err:
+                if self._is_orphaned_warm_task(containers):
+                    self._remove_project(project)
+                    continue
+                log.warning("Unable to reconcile task: %s", task_id)
+                log.debug(err, exc_info=True)
+                continue
+            except (OSError, ValueError, KeyError) as err:
+                log.warning("Unable to reconcile task: %s", task_id)
+                log.debug(err, exc_info=True)
+                continue
+
+            task.snapshot = containers
+            task.launched = True
+            # the task's status is derived from its containers unless its launch failed
+            if task.last_status != "STOPPED":
+                task.last_status = None
+
+            # tasks that were stopped for longer than the retention period were already
+            # evicted from the task store before the restart
+            stopped_at = task.execution_stopped_at
+            if (
+                stopped_at is not None
+                and datetime.timestamp(datetime.now()) - stopped_at
+                >= STOPPED_TASK_RETENTION_SECONDS
+            ):
+                log.debug("Skipping expired stopped task: %s", task_id)
+                continue
+            tasks.append(task)
+
+        # restores the original ListTasks order
+        for task in sorted(tasks, key=lambda task: task.created_at):
+            self.add_task(task)
+            self.update_task(task)
+
+        log.info("Reconciled %i tasks from docker compose projects", len(tasks))
+
+    def launch_task(self, task: RunTaskBackend, overrides=None) -> None:
+        """Launches the task and updates the task's status within the task store"""
+        task.launch(overrides)
+        self.update_task(task)
+
+    def refresh_tasks(self, tasks: List[RunTaskBackend]) -> None:
+        """
+        Refreshes the container snapshots of the launched tasks. Snapshots are read
+        from the docker events cache if it's in sync with docker and otherwise taken
+        using one docker query for all of the tasks.
+
+        Arguments:
+            tasks: Tasks to refresh
+        """
+        tasks = [task for task in tasks if task.launched]
+        if not tasks:
+            return
+
+        if USE_DOCKER_EVENTS and DOCKER_EVENTS.healthy:
+            for task in tasks:
+                task.refresh()
+        else:
+            projects = list_projects_containers(
+                self.docker,
+                [task.docker.client_config.compose_project_name for task in tasks],
+            )
+            for task in tasks:
+                task.snapshot = projects[task.docker.client_config.compose_project_name]
+
+        for task in tasks:
+            self.update_task(task)
 
     def describe_tasks(self, tasks: List[str], include=None) -> Dict[str, Any]:
         """
@@ -498,7 +1095,9 @@ class ECSBackend:
         """
         response = {"tasks": [], "failures": []}
 
-        for task_id in tasks:
+        task_objs = []
+        for task in tasks:
+            task_id = task
             match = re.match(
                 "^arn:aws:ecs:(?P<region>[^:]+):(?P<account_id>[^:]+):(?P<service>[^:]+)/(?P<id>.*)$",
                 task_id,
@@ -506,8 +1105,17 @@ class ECSBackend:
             if match:
                 task_id = match.groupdict()["id"]
 
-            task = self.tasks[task_id]
-            if task.is_failure():
+            try:
+                task_objs.append(self.get_task(task_id))
+            except KeyError:
+                # task never existed or was evicted after being stopped
+                response["failures"].append(Failures(arn=task, reason="MISSING"))
+
+        # all docker-derived attributes are read from a single snapshot per request
+        self.refresh_tasks(task_objs)
+
+        for task in task_objs:
+            if task.launched and task.is_failure():
                 response["failures"].append(
                     Failures(
                         arn=task.task_arn,
@@ -518,34 +1126,45 @@ class ECSBackend:
                 )
                 continue
 
+            if task.launched:
+                # docker compose project attributes are only available once the
+                # task's compose project has been created
+                docker_attr = dict(
+                    executionStoppedAt=task.execution_stopped_at,
+                    healthStatus=task.task_health_status,
+                    stoppedAt=task.execution_stopped_at,
+                    attachments=task.attachments,
+                    platformFamily=task.platform_family,
+                    containers=task.containers,
+                )
+            else:
+                docker_attr = dict(
+                    executionStoppedAt=task.stopped_at,
+                    stoppedAt=task.stopped_at,
+                    containers=[],
+                )
+
             response["tasks"].append(
                 Tasks(
                     lastStatus=task.last_status,
                     createdAt=task.created_at,
-                    executionStoppedAt=task.execution_stopped_at,
-                    healthStatus=task.task_health_status,
-                    # TODO get more precise times for below attributes
-                    pullStartedAt=task.created_at,
-                    pullStoppedAt=task.created_at,
-                    stoppedAt=task.execution_stopped_at,
+                    pullStartedAt=task.pull_started_at,
+                    pullStoppedAt=task.pull_stopped_at,
                     stoppingAt=task.stopping_at,
-                    #
                     startedAt=task.started_at,
                     stopCode=task.stop_code,
                     stoppedReason=task.stopped_reason,
                     availabilityZone=task.region,
-                    attachments=task.attachments,
                     clusterArn=task.cluster_arn,
                     taskArn=task.task_arn,
                     connectivity="CONNECTED",  # TODO replace placeholder
                     connectivityAt=task.created_at,
                     cpu=task.cpu,
-                    desiredStatus="RUNNING",
+                    desiredStatus=task.desired_status,
                     group=task.task_def["family"],
                     memory=task.memory,
-                    platformFamily=task.platform_family,
                     taskDefinitionArn=task.task_def_arn,
-                    containers=task.containers,
+                    **docker_attr,
                     **task.request,
                 ).dict(exclude_unset=True, exclude_none=True)
             )
@@ -554,38 +1173,41 @@ class ECSBackend:
 
     def run_task(self, **kwargs) -> Dict[str, Any]:
         """
-        Returns ECS RunTask response replaced with local docker compose container values
+        Registers the tasks and returns the ECS RunTask response for the PROVISIONING
+        tasks. Each task's docker compose project is created and run concurrently
+        within the backend's executor.
 
         Arguments:
             task_def_arn: List of task IDs or ARNs
             overrides: ECS task and container overrides
-            count: Number of duplicate compose projects to run
+            count: Number of tasks (each within a separate docker compose project) to run
         """
-
-        ecs = boto3.client("ecs", endpoint_url=os.environ.get("ECS_ENDPOINT_URL"))
-        # use base AWS creds for getting task def
-        # so that the task execution role doesn't need extra permissions
-        task_def = ecs.describe_task_definition(taskDefinition=kwargs["taskDefinition"])
-        task = RunTaskBackend(task_def, **kwargs)
-        self.created_at = datetime.timestamp(datetime.now())
-
-        try:
-            task.up(kwargs["count"], kwargs.get("overrides", {}))
-        except DockerException as err:
-            log.debug(
-                "Exit code: %i while running: %s", err.return_code, err.docker_command
+        count = kwargs.get("count", 1)
+        if not 1 <= count <= RUN_TASK_MAX_COUNT:
+            raise InvalidParameterException(
+                f"count must be between 1 and {RUN_TASK_MAX_COUNT}"
             )
-            log.error(err, exc_info=True)
 
-            task.run_exception = err
-            task.stopped_at = datetime.timestamp(datetime.now())
-            task.stopping_at = datetime.timestamp(datetime.now())
-            task.execution_stopped_at = datetime.timestamp(datetime.now())
-            task.last_status = "STOPPED"
-
-        self.tasks[task.id] = task
-
-        return self.describe_tasks(tasks=[task.id])
+        task_def = self.describe_task_definition(kwargs["taskDefinition"])
+        tasks = []
+        for _ in range(count):
+            # copies the request given tasks modify the request (e.g. propagated tags)
+            request = copy.deepcopy(kwargs)
+            # containers created by the warm pool can't be changed by overrides
+            task = None if kwargs.get("overrides") else self.warm_pool.claim(task_def)
+            if task is None:
+                task = RunTaskBackend(task_def, **request)
+            else:
+                task.assign_request(request)
+                task.created_at = datetime.timestamp(datetime.now())
+            self.add_task(task)
+            tasks.append(task)
+
+        # responds with the PROVISIONING tasks while the tasks are launched in the background
+        for task in tasks:
+            self.executor.submit(self.launch_task, task, kwargs.get("overrides", {}))
+
+        return self.describe_tasks(tasks=[task.id for task in tasks])
 
     def list_tasks(
         self,
@@ -597,12 +1219,14 @@ class ECSBackend:
         started_by: Optional[str] = None,
         container_instance: Optional[str] = None,
         max_results: Optional[int] = None,
-    ) -> List[str]:
+        next_token: Optional[str] = None,
+    ) -> Tuple[List[str], Optional[str]]:
         """
         Returns ECS ListTasks response replaced with local docker compose translated ARNs
+        and the token used to retrieve the next page of ARNs
 
         Arguments:
-            cluster: AWS ECS cluster name to filter by
+            cluster: AWS ECS cluster name or ARN to filter by
             family: AWS ECS task defintion family to filter by
             launch_type: AWS ECS launch type to filter by
             service_name: Name of the ECS service to filter by
@@ -610,27 +1234,46 @@ class ECSBackend:
             started_by: `startedBy` value used in RunTask API call to filter by
             container_instance: AWS ECS container instance ID or ARN to filter by
             max_results: Maximum number of task ARNs to return
+            next_token: Token returned by a previous ListTasks call
         """
-        arns = []
-        for task in self.tasks.values():
-            if cluster is not None and task.request["cluster"] != cluster:
-                continue
-            elif family is not None and task.task_def["family"] != family:
-                continue
-            elif launch_type is not None and task.request["launchType"] != launch_type:
-                continue
-            elif service_name is not None and service_name not in task.service_names:
-                continue
-            elif desired_status is not None and task.last_status != desired_status:
-                continue
-            elif started_by is not None and task.request.get("startedBy") != started_by:
-                continue
-            elif (
-                container_instance is not None
-                and task.container_instance != container_instance
-            ):
-                continue
-
-            arns.append(task.task_arn)
+        if max_results is None:
+            max_results = LIST_TASKS_MAX_RESULTS
+        elif not 1 <= max_results <= LIST_TASKS_MAX_RESULTS:
+            raise InvalidParameterException(
+                f"maxResults must be between 1 and {LIST_TASKS_MAX_RESULTS}"
+            )
 
-        return arns[:max_results]
+        if desired_status is not None and not (
+            USE_DOCKER_EVENTS and DOCKER_EVENTS.healthy
+        ):
+            # docker events aren't updating the status index so the RUNNING tasks are
+            # refreshed given they are the only tasks that can transition to STOPPED
+            self.refresh_tasks(self.tasks.query({"desiredStatus": "RUNNING"})[0])
+
+        filters = {
+            "cluster": self._cluster_name(cluster) if cluster is not None else None,
+            "family": family,
+            "launchType": launch_type,
+            "startedBy": started_by,
+            "containerInstance": container_instance,
+            "desiredStatus": desired_status,
+        }
+        filters = {name: value for name, value in filters.items() if value is not None}
+        if service_name is None:
+            tasks, next_token = self.tasks.query(filters, next_token, max_results)
+            return [task.task_arn for task in tasks], next_token
+
+        # the service name isn't indexed so pages are filtered until the page is full
+        arns = []
+        while True:
+            tasks, next_token = self.tasks.query(
+                filters, next_token, max_results - len(arns)
+            )
+            self.refresh_tasks(tasks)
+            arns += [
+                task.task_arn for task in tasks if service_name in task.service_names
+            ]
+            if next_token is None or len(arns) == max_results:
+                break
+
+        return arns, next_token
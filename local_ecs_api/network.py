@@ -0,0 +1,181 @@
+import ipaddress
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from python_on_whales import DockerClient
+
+from local_ecs_api.exceptions import IPAddressCapacityException
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+
+class IPAllocator:
+    """
+    Thread-safe allocator of the static IP addresses assigned to task containers
+    within a docker network. Addresses are tracked within a bitmap over the network's
+    subnet and are reserved per owner (task ID) until the owner releases them. The
+    bitmap is only resynced from `docker network inspect` on first use and when the
+    subnet is exhausted.
+
+    If `leases` is set, allocated addresses are also leased within the shared lease
+    store so that allocators of other processes don't allocate the same addresses.
+
+    Arguments:
+        docker: Docker client used to inspect the network
+        network_name: Docker network name
+        reserved: IP addresses that are never allocated (e.g. static service IPs)
+        leases: Lease store shared with other processes (see `SQLiteIPLeases`)
+    """
+
+    def __init__(
+        self,
+        docker: DockerClient,
+        network_name: str,
+        reserved: List[str] = None,
+        leases=None,
+    ):
+        self.docker = docker
+        self.network_name = network_name
+        self.reserved = reserved or []
+        self.leases = leases
+
+        self.subnet: Optional[ipaddress.IPv4Network] = None
+        # one byte per subnet address (1 if the address is in use)
+        self._bitmap = bytearray()
+        # offset to start searching for free addresses from (next-fit)
+        self._cursor = 0
+        self._owners: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _offset(self, ip: str) -> Optional[int]:
+        try:
+            address = ipaddress.IPv4Address(ip)
+        except ValueError:
+            return
+        if address in self.subnet:
+            return int(address) - int(self.subnet.network_address)
+
+    def resync(self) -> None:
+        """Rebuilds the bitmap from the docker network's subnet and connected containers"""
+        with self._lock:
+            self._resync()
+
+    def _resync(self) -> None:
+        network = self.docker.network.inspect(self.network_name)
+        subnet = ipaddress.IPv4Network(network.ipam.config[0]["Subnet"])
+        if self.subnet != subnet:
+            log.info(
+                "Allocating %s addresses from subnet: %s", self.network_name, subnet
+            )
+        self.subnet = subnet
+        # NOTE: can't rely on docker network inspect results to get Gateway IP given
+        # it's not always an attribute in ipam config (only Subnet)
+        gateway = network.ipam.config[0].get("Gateway") or str(
+            self.subnet.network_address + 1
+        )
+
+        self._bitmap = bytearray(self.subnet.num_addresses)
+        self._bitmap[0] = 1
+        self._bitmap[-1] = 1
+
+        used = [gateway] + self.reserved
+        used += [c.ipv4_address for c in network.containers.values()]
+        if self.leases is not None:
+            used += self.leases.leased()
+        for ip in used:
+            offset = self._offset((ip or "").split("/")[0])
+            if offset is not None:
+                self._bitmap[offset] = 1
+
+        for offsets in self._owners.values():
+            for offset in offsets:
+                self._bitmap[offset] = 1
+
+        log.debug(
+            "Synced %s addresses -- used: %i/%i",
+            self.network_name,
+            sum(self._bitmap),
+            len(self._bitmap),
+        )
+
+    def _find(self) -> Optional[int]:
+        offset = self._bitmap.find(0, self._cursor)
+        if offset == -1:
+            offset = self._bitmap.find(0, 0, self._cursor)
+        return offset if offset != -1 else None
+
+    def allocate(self, owner: str, count: int) -> List[str]:
+        """
+        Reserves and returns `count` free IP addresses for the owner
+
+        Arguments:
+            owner: ID of the owner of the addresses (e.g. task ID)
+            count: Number of addresses to reserve
+        """
+        with self._lock:
+            if self.subnet is None:
+                self._resync()
+
+            while True:
+                offsets = self._reserve(count)
+                ips = [str(self.subnet.network_address + offset) for offset in offsets]
+                if self.leases is None:
+                    break
+
+                taken = self.leases.claim(owner, ips)
+                if not taken:
+                    break
+                # addresses leased by other processes stay marked as in use
+                log.debug("IP addresses are leased by another process: %s", taken)
+                for offset, ip in zip(offsets, ips):
+                    if ip not in taken:
+                        self._bitmap[offset] = 0
+
+            self._owners.setdefault(owner, []).extend(offsets)
+
+            return ips
+
+    def _reserve(self, count: int) -> List[int]:
+        """Marks and returns the offsets of `count` free addresses (lock must be held)"""
+        offsets = self._try_reserve(count)
+        if offsets is None:
+            # addresses may have been released outside of the allocator
+            self._resync()
+            offsets = self._try_reserve(count)
+
+        if offsets is None:
+            raise IPAddressCapacityException(
+                f"No free IP addresses within {self.network_name} ({self.subnet})"
+            )
+
+        return offsets
+
+    def _try_reserve(self, count: int) -> Optional[List[int]]:
+        """
+        Marks and returns the offsets of `count` free addresses or returns None without
+        marking any addresses if there aren't enough free addresses
+        """
+        offsets = []
+        while len(offsets) < count:
+            offset = self._find()
+            if offset is None:
+                # rolls back the partial reservation
+                for offset in offsets:
+                    self._bitmap[offset] = 0
+                return
+
+            self._bitmap[offset] = 1
+            self._cursor = offset + 1
+            offsets.append(offset)
+
+        return offsets
+
+    def release(self, owner: str) -> None:
+        """Releases the IP addresses reserved for the owner"""
+        with self._lock:
+            for offset in self._owners.pop(owner, []):
+                self._bitmap[offset] = 0
+        if self.leases is not None:
+            self.leases.release(owner)
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# task definitions (family or family:revision) to keep pre-created tasks for
+WARM_POOL_TASK_DEFINITIONS = [
+    task_def
+    for task_def in os.environ.get("WARM_POOL_TASK_DEFINITIONS", "").split(",")
+    if task_def != ""
+]
+# number of pre-created tasks to keep for each WARM_POOL_TASK_DEFINITIONS task definition
+WARM_POOL_SIZE = int(os.environ.get("WARM_POOL_SIZE", 2))
+# number of seconds pre-created tasks are kept before they are recreated so that
+# task secrets and credentials are resolved again
+WARM_POOL_MAX_AGE = float(os.environ.get("WARM_POOL_MAX_AGE", 600))
+
+
+class WarmTaskPool:
+    """
+    Keeps `size` tasks for each of the task definitions whose docker compose projects
+    are created but not started so that RunTask only needs to start the task's
+    containers. The pools are refilled within a background thread whenever a task is
+    claimed and tasks older than `max_age` are replaced.
+
+    Arguments:
+        task_definitions: Task definition families or family:revisions to pool tasks for
+        size: Number of tasks to keep for each task definition
+        max_age: Number of seconds tasks are kept before they're replaced
+        describe: Function that returns the DescribeTaskDefinition response for the
+            task definition
+        create: Function that returns a created task for the DescribeTaskDefinition response
+        remove: Function that removes an unclaimed task's docker resources
+    """
+
+    def __init__(
+        self,
+        task_definitions: List[str],
+        size: int,
+        max_age: float,
+        describe: Callable[[str], Dict[str, Any]],
+        create: Callable[[Dict[str, Any]], Any],
+        remove: Callable[[Any], None],
+    ):
+        self.task_definitions = task_definitions
+        self.size = size
+        self.max_age = max_age
+        self.describe = describe
+        self.create = create
+        self.remove = remove
+
+        # task definition family:revision -> (creation time, task) ordered by creation
+        self._pools: Dict[str, Deque[Tuple[float, Any]]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def key(task_def: Dict[str, Any]) -> str:
+        """Returns the family:revision of the DescribeTaskDefinition response"""
+        return "{family}:{revision}".format(**task_def["taskDefinition"])
+
+    def start(self) -> None:
+        """Starts filling the pools within a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="warm-task-pool", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops filling the pools and removes the unclaimed tasks"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+        with self._lock:
+            tasks = [task for pool in self._pools.values() for _, task in pool]
+            self._pools = {}
+        self._remove(tasks)
+
+    def claim(self, task_def: Dict[str, Any]) -> Optional[Any]:
+        """
+        Returns a created task for the DescribeTaskDefinition response or None if
+        the task definition's pool is empty
+
+        Arguments:
+            task_def: DescribeTaskDefinition response
+        """
+        with self._lock:
+            pool = self._pools.get(self.key(task_def))
+            # claims the most recently created task (expired tasks are removed by the refill)
+            if not pool or time.monotonic() - pool[-1][0] >= self.max_age:
+                return
+            _, task = pool.pop()
+
+        log.debug("Claimed warm task: %s", task.id)
+        self._wake.set()
+        return task
+
+    def _remove(self, tasks: List[Any]) -> None:
+        for task in tasks:
+            try:
+                self.remove(task)
+            except Exception as err:
+                log.error("Failed to remove warm task: %s", task.id)
+                log.debug(err, exc_info=True)
+
+    def refill(self) -> None:
+        """
+        Creates tasks until each task definition's pool is full and removes the tasks
+        that are expired or of task definition revisions no longer pooled
+        """
+        keys = {}
+        for task_definition in self.task_definitions:
+            task_def = self.describe(task_definition)
+            keys[self.key(task_def)] = task_def
+
+        stale = []
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._pools):
+                if key not in keys:
+                    stale += [task for _, task in self._pools.pop(key)]
+                    continue
+                pool = self._pools[key]
+                while pool and now - pool[0][0] >= self.max_age:
+                    stale.append(pool.popleft()[1])
+            for key in keys:
+                self._pools.setdefault(key, deque())
+        self._remove(stale)
+
+        for key, task_def in keys.items():
+            while len(self._pools[key]) < self.size and not self._stop.is_set():
+                log.debug("Creating warm task for: %s", key)
+                task = self.create(task_def)
+                with self._lock:
+                    self._pools[key].append((time.monotonic(), task))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.refill()
+            except Exception as err:
+                log.error("Failed to refill warm task pool: %s", err)
+                log.debug(err, exc_info=True)
+            # wakes up once a task is claimed or to replace expired tasks
+            self._wake.wait(min(self.max_age, 60))
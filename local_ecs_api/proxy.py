@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import httpx
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from local_ecs_api.cache import TTLCache
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# endpoint that unsupported ECS API requests are forwarded to
+ECS_ENDPOINT_URL = os.environ.get("ECS_ENDPOINT_URL", "https://ecs.amazonaws.com")
+# maximum number of concurrent connections to ECS_ENDPOINT_URL
+PROXY_MAX_CONNECTIONS = int(os.environ.get("PROXY_MAX_CONNECTIONS", 100))
+# maximum number of idle connections to ECS_ENDPOINT_URL that are kept alive
+PROXY_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("PROXY_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+# number of seconds to wait for ECS_ENDPOINT_URL to respond
+PROXY_TIMEOUT = float(os.environ.get("PROXY_TIMEOUT", 10))
+
+# read-only ECS actions (e.g. DescribeTaskDefinition) whose responses are cached
+PROXY_CACHE_ACTIONS = [
+    action
+    for action in os.environ.get("PROXY_CACHE_ACTIONS", "").split(",")
+    if action != ""
+]
+# number of seconds cached ECS responses are valid for
+PROXY_CACHE_TTL = float(os.environ.get("PROXY_CACHE_TTL", 30))
+# maximum number of cached responses per ECS action
+PROXY_CACHE_SIZE = int(os.environ.get("PROXY_CACHE_SIZE", 512))
+
+# mutating ECS actions and the read-only actions whose cached responses they invalidate.
+# any other action that isn't read-only invalidates all cached responses.
+INVALIDATED_ACTIONS = {
+    **dict.fromkeys(
+        [
+            "RegisterTaskDefinition",
+            "DeregisterTaskDefinition",
+            "DeleteTaskDefinitions",
+        ],
+        [
+            "DescribeTaskDefinition",
+            "ListTaskDefinitions",
+            "ListTaskDefinitionFamilies",
+        ],
+    ),
+    **dict.fromkeys(
+        [
+            "CreateCluster",
+            "DeleteCluster",
+            "UpdateCluster",
+            "UpdateClusterSettings",
+            "PutClusterCapacityProviders",
+        ],
+        ["DescribeClusters", "ListClusters"],
+    ),
+}
+READ_ONLY_ACTION_PREFIXES = ("Describe", "List", "Get")
+
+# headers that only apply to a single connection and aren't forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+# headers of the upstream response that don't apply once the response content has been
+# decoded and buffered (e.g. cached responses)
+BUFFERED_RESPONSE_EXCLUDED_HEADERS = HOP_BY_HOP_HEADERS | {
+    "content-encoding",
+    "content-length",
+}
+
+
+class ResponseCache:
+    """
+    Read-through cache of successful responses for read-only ECS actions keyed by
+    the action and the normalized request body. Each action has a generation that is
+    incremented when the action's responses are invalidated so that responses of
+    requests sent before the invalidation aren't cached.
+
+    Arguments:
+        actions: ECS actions to cache the responses of
+        ttl: Number of seconds cached responses are valid for
+        maxsize: Maximum number of cached responses per action
+    """
+
+    def __init__(self, actions: List[str], ttl: float, maxsize: int):
+        self.caches: Dict[str, TTLCache] = {
+            action: TTLCache(maxsize=maxsize, ttl=ttl) for action in actions
+        }
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._generations: Dict[str, int] = dict.fromkeys(actions, 0)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(body: bytes) -> str:
+        """Returns the request body with consistent JSON key order and whitespace"""
+        try:
+            return json.dumps(json.loads(body or b"{}"), sort_keys=True)
+        except ValueError:
+            return body.decode("latin-1")
+
+    def get(self, action: str, body: bytes) -> Optional[Response]:
+        """Returns the cached response for the request or None if it isn't cached"""
+        cache = self.caches.get(action)
+        if cache is None:
+            return
+
+        cached = cache.get(self.key(body))
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if cached is not None:
+            status_code, headers, content = cached
+            return Response(content=content, status_code=status_code, headers=headers)
+
+    def generation(self, action: str) -> Optional[int]:
+        """Returns the action's current generation or None if the action isn't cached"""
+        with self._lock:
+            return self._generations.get(action)
+
+    def set(
+        self,
+        action: str,
+        body: bytes,
+        response: httpx.Response,
+        generation: Optional[int] = None,
+    ) -> None:
+        """
+        Caches the response if the action is cached and the response is successful
+
+        Arguments:
+            action: ECS action of the request
+            body: Request body
+            response: Upstream response with its content read
+            generation: Action's generation when the request was sent. The response
+                isn't cached if the action's responses were invalidated since.
+        """
+        cache = self.caches.get(action)
+        if cache is None or response.status_code != 200:
+            return
+
+        headers = {
+            key: value
+            for key, value in response.headers.items()
+            if key.lower() not in BUFFERED_RESPONSE_EXCLUDED_HEADERS
+        }
+        with self._lock:
+            if generation is not None and generation != self._generations[action]:
+                return
+            cache.set(self.key(body), (response.status_code, headers, response.content))
+
+    def invalidate(self, action: str) -> None:
+        """Removes the cached responses that the mutating action may change"""
+        if action.startswith(READ_ONLY_ACTION_PREFIXES) or not self.caches:
+            return
+
+        with self._lock:
+            for invalidated in INVALIDATED_ACTIONS.get(action, self.caches.keys()):
+                if invalidated in self.caches:
+                    self.caches[invalidated].clear()
+                    self._generations[invalidated] += 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the cache's hit, miss and invalidation counters"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": sum(len(cache) for cache in self.caches.values()),
+            }
+
+
+class EcsProxy:
+    """
+    Forwards requests to the ECS endpoint using a pooled async HTTP client. Request
+    bodies are forwarded as is and responses are streamed back to the client.
+    Responses of the `cache` actions are served from the cache if possible.
+
+    Arguments:
+        url: ECS endpoint URL
+        max_connections: Maximum number of concurrent connections to the endpoint
+        max_keepalive_connections: Maximum number of idle connections kept alive
+        timeout: Number of seconds to wait for the endpoint
+        cache: Response cache for read-only actions
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_connections: int,
+        max_keepalive_connections: int,
+        timeout: float,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.url = url
+        self.cache = cache
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.timeout = httpx.Timeout(timeout, pool=None)
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        """Creates the HTTP client"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+
+    async def stop(self) -> None:
+        """Closes the HTTP client's connections"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def forward(self, request: Request) -> Response:
+        """
+        Forwards the request to the ECS endpoint and returns the streamed response
+
+        Arguments:
+            request: Request to forward
+        """
+        await self.start()
+
+        action = request.headers.get("x-amz-target", "").split(".")[-1]
+        body = await request.body()
+        generation = None
+        if self.cache is not None:
+            cached = self.cache.get(action, body)
+            if cached is not None:
+                log.debug("Using cached response for: %s", action)
+                return cached
+            generation = self.cache.generation(action)
+
+        headers = [
+            (key, value)
+            for key, value in request.headers.raw
+            if key.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS
+        ]
+        upstream_request = self.client.build_request(
+            request.method,
+            self.url,
+            headers=headers,
+            content=body,
+        )
+
+        if generation is not None:
+            # cached responses are read entirely instead of streamed
+            response = await self.client.send(upstream_request)
+            self.cache.set(action, body, response, generation)
+            return Response(
+                content=response.content,
+                status_code=response.status_code,
+                headers={
+                    key: value
+                    for key, value in response.headers.items()
+                    if key.lower() not in BUFFERED_RESPONSE_EXCLUDED_HEADERS
+                },
+            )
+
+        try:
+            response = await self.client.send(upstream_request, stream=True)
+        finally:
+            if self.cache is not None:
+                # invalidated once the upstream has processed the mutating action so
+                # that responses read while the action was in flight aren't served
+                self.cache.invalidate(action)
+
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers={
+                key: value
+                for key, value in response.headers.items()
+                if key.lower() not in HOP_BY_HOP_HEADERS
+            },
+            background=BackgroundTask(response.aclose),
+        )
+
+
+ECS_PROXY = EcsProxy(
+    ECS_ENDPOINT_URL,
+    PROXY_MAX_CONNECTIONS,
+    PROXY_MAX_KEEPALIVE_CONNECTIONS,
+    PROXY_TIMEOUT,
+    cache=ResponseCache(PROXY_CACHE_ACTIONS, PROXY_CACHE_TTL, PROXY_CACHE_SIZE)
+    if PROXY_CACHE_ACTIONS
+    else None,
+)
@@ -0,0 +1,601 @@
+import base64
+import binascii
+import heapq
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from local_ecs_api.cache import TTLCache
+from local_ecs_api.exceptions import InvalidParameterException
+
+log = logging.getLogger("local-ecs-api")
+log.setLevel(logging.DEBUG)
+
+# default and maximum number of task ARNs returned per ListTasks page
+LIST_TASKS_MAX_RESULTS = 100
+
+
+class TaskStore:
+    """
+    Thread-safe store of the local tasks with secondary indexes on the ListTasks
+    filter attributes. Tasks are ordered by the sequence number they were added with
+    so that ListTasks pages are stable while new tasks are added.
+
+    Stopped tasks are retained in the order they were found to be stopped and the
+    oldest stopped tasks are evicted once there are more than `max_stopped` stopped
+    tasks or once they have been stopped for `stopped_ttl` seconds. Tasks that
+    aren't stopped are never evicted.
+
+    Arguments:
+        index_keys: Mapping of index name to function that returns the task's
+            value for the index
+        is_stopped: Function that returns True if the task is stopped
+        max_stopped: Maximum number of stopped tasks to retain (`None` for no limit)
+        stopped_ttl: Number of seconds stopped tasks are retained for (`None` for no limit)
+    """
+
+    def __init__(
+        self,
+        index_keys: Dict[str, Any],
+        is_stopped: Optional[Callable[[Any], bool]] = None,
+        max_stopped: Optional[int] = None,
+        stopped_ttl: Optional[float] = None,
+    ):
+        self.index_keys = index_keys
+        self.is_stopped = is_stopped
+        self.max_stopped = max_stopped
+        self.stopped_ttl = stopped_ttl
+        self._tasks: Dict[str, Any] = {}
+        self._seqs: Dict[str, int] = {}
+        self._counter = itertools.count()
+        # index name -> attribute value -> task IDs
+        self._indexes: Dict[str, Dict[Hashable, Set[str]]] = {
+            name: {} for name in index_keys
+        }
+        # task ID -> index name -> indexed attribute value
+        self._values: Dict[str, Dict[str, Hashable]] = {}
+        # stopped task ID -> time the task was found to be stopped (oldest first)
+        self._stopped: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, task: Any) -> None:
+        """Adds the task to the store and indexes"""
+        values, stopped = self._index_values(task)
+        with self._lock:
+            self._tasks[task.id] = task
+            self._seqs[task.id] = next(self._counter)
+            self._values[task.id] = {}
+            self._index(task.id, values, stopped)
+
+    def get(self, task_id: str) -> Any:
+        """Returns the task associated with the task ID (raises KeyError if it was evicted)"""
+        with self._lock:
+            self._evict()
+            return self._tasks[task_id]
+
+    def values(self) -> List[Any]:
+        """Returns a point-in-time copy of all tasks within the store"""
+        with self._lock:
+            self._evict()
+            return list(self._tasks.values())
+
+    def reindex(self, task: Any) -> None:
+        """Updates the indexes for the task's current attribute values (e.g. status)"""
+        values, stopped = self._index_values(task)
+        with self._lock:
+            if task.id in self._tasks:
+                self._index(task.id, values, stopped)
+
+    def _index_values(self, task: Any) -> Tuple[Dict[str, Hashable], bool]:
+        """
+        Returns the task's index values and whether the task is stopped. The values are
+        computed without holding the store's lock given they may run docker commands
+        (e.g. task status).
+        """
+        values = {name: key(task) for name, key in self.index_keys.items()}
+        stopped = self.is_stopped is not None and self.is_stopped(task)
+        return values, stopped
+
+    def _index(self, task_id: str, values: Dict[str, Hashable], stopped: bool) -> None:
+        indexed = self._values[task_id]
+        for name, value in values.items():
+            if name in indexed:
+                if indexed[name] == value:
+                    continue
+                ids = self._indexes[name][indexed[name]]
+                ids.discard(task_id)
+                if not ids:
+                    del self._indexes[name][indexed[name]]
+
+            self._indexes[name].setdefault(value, set()).add(task_id)
+            indexed[name] = value
+
+        if stopped and task_id not in self._stopped:
+            self._stopped[task_id] = time.monotonic()
+            self._evict()
+
+    def _evict(self) -> None:
+        """Removes the oldest stopped tasks that exceed the retention limits"""
+        now = time.monotonic()
+        while self._stopped:
+            task_id, stopped_at = next(iter(self._stopped.items()))
+            if (
+                self.max_stopped is None or len(self._stopped) <= self.max_stopped
+            ) and (self.stopped_ttl is None or now - stopped_at < self.stopped_ttl):
+                break
+
+            del self._stopped[task_id]
+            self._remove(task_id)
+
+    def _remove(self, task_id: str) -> None:
+        del self._tasks[task_id]
+        del self._seqs[task_id]
+        for name, value in self._values.pop(task_id).items():
+            ids = self._indexes[name][value]
+            ids.discard(task_id)
+            if not ids:
+                del self._indexes[name][value]
+
+    @staticmethod
+    def encode_token(seq: int) -> str:
+        """Returns the opaque pagination token for the sequence number"""
+        return base64.urlsafe_b64encode(json.dumps({"seq": seq}).encode()).decode()
+
+    @staticmethod
+    def decode_token(token: str) -> int:
+        """Returns the sequence number encoded within the pagination token"""
+        try:
+            return int(json.loads(base64.urlsafe_b64decode(token.encode()))["seq"])
+        except (binascii.Error, ValueError, TypeError, KeyError) as err:
+            raise InvalidParameterException("Invalid nextToken") from err
+
+    def query(
+        self,
+        filters: Dict[str, Hashable],
+        next_token: Optional[str] = None,
+        max_results: Optional[int] = None,
+    ) -> Tuple[List[Any], Optional[str]]:
+        """
+        Returns up to `max_results` tasks that match all of the indexed filters in the
+        order the tasks were added along with the pagination token that resumes the
+        query after the last returned task (`None` if there are no more matches)
+
+        Arguments:
+            filters: Mapping of index name to the value to filter by
+            next_token: Token returned by a previous query to resume from
+            max_results: Maximum number of tasks to return (`None` for no limit)
+        """
+        start = self.decode_token(next_token) if next_token else -1
+        # one extra match is selected to determine if there's a next page
+        limit = max_results + 1 if max_results is not None else None
+        with self._lock:
+            self._evict()
+            if filters:
+                # intersects the indexes starting from the smallest one
+                indexes = sorted(
+                    (
+                        self._indexes[name].get(value, set())
+                        for name, value in filters.items()
+                    ),
+                    key=len,
+                )
+                matches = (
+                    (self._seqs[task_id], task_id)
+                    for task_id in indexes[0].intersection(*indexes[1:])
+                    if self._seqs[task_id] > start
+                )
+                # selects the page without sorting all of the matches
+                matches = (
+                    heapq.nsmallest(limit, matches)
+                    if limit is not None
+                    else sorted(matches)
+                )
+            else:
+                # tasks are stored in sequence order so the scan stops once the
+                # page is full
+                matches = itertools.islice(
+                    (
+                        (self._seqs[task_id], task_id)
+                        for task_id in self._tasks
+                        if self._seqs[task_id] > start
+                    ),
+                    limit,
+                )
+            matches = list(matches)
+            tasks = [self._tasks[task_id] for _, task_id in matches[:max_results]]
+
+        if limit is not None and len(matches) == limit:
+            return tasks, self.encode_token(matches[max_results - 1][0])
+        return tasks, None
+
+
+# schema of the SQLite task store (see `SQLiteTaskStore`)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    -- JSON task definition, RunTask request and lifecycle timestamps
+    record TEXT NOT NULL,
+    -- incremented whenever the record changes (used for compare-and-swap updates)
+    version INTEGER NOT NULL DEFAULT 0,
+    -- unix time the task was found to be stopped
+    stopped_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_stopped_at ON tasks (stopped_at)
+    WHERE stopped_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS task_indexes (
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    task_id TEXT NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+    PRIMARY KEY (name, value, task_id)
+);
+CREATE INDEX IF NOT EXISTS task_indexes_task_id ON task_indexes (task_id);
+
+CREATE TABLE IF NOT EXISTS task_status_history (
+    task_id TEXT NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+    status TEXT NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_status_history_task_id
+    ON task_status_history (task_id);
+
+CREATE TABLE IF NOT EXISTS ip_leases (
+    ip TEXT PRIMARY KEY,
+    owner TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ip_leases_owner ON ip_leases (owner);
+"""
+
+
+class SQLiteDatabase:
+    """
+    SQLite database in WAL mode that can be shared by multiple processes. Each thread
+    uses its own connection given SQLite connections can't be shared across threads.
+
+    Arguments:
+        path: Path to the SQLite database file
+        timeout: Number of seconds to wait for other connections' write locks
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self.connect().executescript(SQLITE_SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        """Returns the current thread's connection to the database"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # transactions are managed explicitly by `transaction()`
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs the statements within a write transaction that is committed on exit"""
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Task store that persists task records within a SQLite database so that tasks
+    survive restarts and are shared by all API worker processes using the same
+    database. Tasks are loaded from their records with `load` and are cached
+    in-process until their record changes. Each task's status changes are recorded
+    within the `task_status_history` table.
+
+    Records are versioned and a task's record is only updated if the record wasn't
+    changed since the task instance was loaded or last written so that a worker
+    holding a stale task doesn't overwrite another worker's update.
+
+    Arguments:
+        db: SQLite database
+        index_keys: Mapping of index name to function that returns the task's
+            value for the index
+        load: Function that returns the task for the task's record (see `to_record()`)
+        is_stopped: Function that returns True if the task is stopped
+        max_stopped: Maximum number of stopped tasks to retain (`None` for no limit)
+        stopped_ttl: Number of seconds stopped tasks are retained for (`None` for no limit)
+        status_key: Function that returns the task's status for the status history
+        cache_size: Maximum number of loaded tasks cached in-process
+    """
+
+    def __init__(
+        self,
+        db: SQLiteDatabase,
+        index_keys: Dict[str, Any],
+        load: Callable[[Dict[str, Any]], Any],
+        is_stopped: Optional[Callable[[Any], bool]] = None,
+        max_stopped: Optional[int] = None,
+        stopped_ttl: Optional[float] = None,
+        status_key: Optional[Callable[[Any], Optional[str]]] = None,
+        cache_size: int = 1024,
+    ):
+        super().__init__(index_keys, is_stopped, max_stopped, stopped_ttl)
+        self.db = db
+        self.load = load
+        self.status_key = status_key
+        # task ID -> (record, index values, task)
+        self._cache = TTLCache(maxsize=cache_size)
+        # id() of task instance -> record version the instance was loaded or written with
+        self._versions: Dict[int, int] = {}
+
+    def _set_version(self, task: Any, version: int) -> None:
+        key = id(task)
+        if key not in self._versions:
+            # the version is removed once the task instance is garbage collected
+            weakref.finalize(task, self._versions.pop, key, None)
+        self._versions[key] = version
+
+    def _dump(self, task: Any) -> Tuple[str, Dict[str, str]]:
+        """Returns the task's record and index values as they're stored"""
+        record = json.dumps(task.to_record(), sort_keys=True, default=str)
+        values = {
+            name: json.dumps(key(task), default=str)
+            for name, key in self.index_keys.items()
+        }
+        return record, values
+
+    def _write_indexes(
+        self, conn: sqlite3.Connection, task: Any, values: Dict[str, str]
+    ) -> None:
+        conn.execute("DELETE FROM task_indexes WHERE task_id = ?", (task.id,))
+        conn.executemany(
+            "INSERT INTO task_indexes (name, value, task_id) VALUES (?, ?, ?)",
+            [(name, value, task.id) for name, value in values.items()],
+        )
+
+        status = self.status_key(task) if self.status_key else None
+        if status is None:
+            return
+        last = conn.execute(
+            "SELECT status FROM task_status_history WHERE task_id = ? "
+            "ORDER BY rowid DESC LIMIT 1",
+            (task.id,),
+        ).fetchone()
+        if last is None or last[0] != status:
+            conn.execute(
+                "INSERT INTO task_status_history (task_id, status, recorded_at) "
+                "VALUES (?, ?, ?)",
+                (task.id, status, time.time()),
+            )
+
+    def add(self, task: Any) -> None:
+        """Adds the task's record to the store"""
+        record, values = self._dump(task)
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO tasks (id, record) VALUES (?, ?)", (task.id, record)
+            )
+            self._write_indexes(conn, task, values)
+        self._set_version(task, 0)
+        self._cache.set(task.id, (record, values, task))
+
+    def reindex(self, task: Any) -> None:
+        """
+        Writes the task's record and indexes if they changed since last written and
+        the task's record wasn't changed by another instance of the task since
+        """
+        record, values = self._dump(task)
+        cached = self._cache.get(task.id)
+        if cached is not None and cached[2] is task and cached[:2] == (record, values):
+            return
+
+        version = self._versions.get(id(task))
+        stopped = self.is_stopped is not None and self.is_stopped(task)
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT record, version FROM tasks WHERE id = ?", (task.id,)
+            ).fetchone()
+            if row is None:
+                # task was evicted
+                return
+            if version is not None and row[1] != version:
+                log.debug("Skipping update of stale task: %s", task.id)
+                if cached is not None and cached[2] is task:
+                    # the task is loaded from the newer record on the next read
+                    self._cache.pop(task.id)
+                return
+
+            version = row[1] + (row[0] != record)
+            conn.execute(
+                "UPDATE tasks SET record = ?, version = ?, "
+                "stopped_at = COALESCE(stopped_at, ?) WHERE id = ?",
+                (record, version, time.time() if stopped else None, task.id),
+            )
+            self._write_indexes(conn, task, values)
+            if stopped:
+                self._evict_records(conn)
+        self._set_version(task, version)
+        self._cache.set(task.id, (record, values, task))
+
+    def _evict_records(self, conn: sqlite3.Connection) -> None:
+        """Deletes the oldest stopped tasks that exceed the retention limits"""
+        if self.stopped_ttl is not None:
+            conn.execute(
+                "DELETE FROM tasks WHERE stopped_at <= ?",
+                (time.time() - self.stopped_ttl,),
+            )
+        if self.max_stopped is not None:
+            conn.execute(
+                "DELETE FROM tasks WHERE id IN (SELECT id FROM tasks "
+                "WHERE stopped_at IS NOT NULL ORDER BY stopped_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_stopped,),
+            )
+
+    def _retained(self) -> Tuple[str, List[Any]]:
+        """
+        Returns the condition that excludes stopped tasks past `stopped_ttl` that
+        haven't been deleted yet (deletes only happen within write transactions)
+        """
+        if self.stopped_ttl is None:
+            return "1 = 1", []
+        return "(stopped_at IS NULL OR stopped_at > ?)", [
+            time.time() - self.stopped_ttl
+        ]
+
+    def _load(self, task_id: str, record: str, version: int) -> Any:
+        cached = self._cache.get(task_id)
+        if cached is not None and cached[0] == record:
+            task = cached[2]
+        else:
+            task = self.load(json.loads(record))
+            self._cache.set(task_id, (record, None, task))
+
+        self._set_version(task, version)
+        return task
+
+    def get(self, task_id: str) -> Any:
+        """Returns the task associated with the task ID (raises KeyError if it was evicted)"""
+        condition, params = self._retained()
+        row = (
+            self.db.connect()
+            .execute(
+                f"SELECT record, version FROM tasks WHERE id = ? AND {condition}",
+                [task_id] + params,
+            )
+            .fetchone()
+        )
+        if row is None:
+            self._cache.pop(task_id)
+            raise KeyError(task_id)
+
+        return self._load(task_id, *row)
+
+    def values(self) -> List[Any]:
+        """Returns all tasks within the store"""
+        return self.query({})[0]
+
+    def query(
+        self,
+        filters: Dict[str, Hashable],
+        next_token: Optional[str] = None,
+        max_results: Optional[int] = None,
+    ) -> Tuple[List[Any], Optional[str]]:
+        """
+        Returns up to `max_results` tasks that match all of the indexed filters in the
+        order the tasks were added along with the pagination token that resumes the
+        query after the last returned task (`None` if there are no more matches)
+
+        Arguments:
+            filters: Mapping of index name to the value to filter by
+            next_token: Token returned by a previous query to resume from
+            max_results: Maximum number of tasks to return (`None` for no limit)
+        """
+        start = self.decode_token(next_token) if next_token else -1
+        condition, params = self._retained()
+
+        # the page is selected within SQLite by seeking past the token's sequence
+        # number so that only the returned tasks are loaded
+        sql = (
+            "SELECT seq, id, record, version FROM tasks "
+            f"WHERE seq > ? AND {condition}"
+        )
+        params = [start] + params
+        for name, value in filters.items():
+            sql += " AND id IN (SELECT task_id FROM task_indexes WHERE name = ? AND value = ?)"
+            params += [name, json.dumps(value, default=str)]
+        sql += " ORDER BY seq"
+        if max_results is not None:
+            # one extra row is selected to determine if there's a next page
+            sql += " LIMIT ?"
+            params.append(max_results + 1)
+
+        rows = self.db.connect().execute(sql, params).fetchall()
+        tasks = [
+            self._load(task_id, record, version)
+            for _, task_id, record, version in rows[:max_results]
+        ]
+        if max_results is not None and len(rows) > max_results:
+            return tasks, self.encode_token(rows[max_results - 1][0])
+        return tasks, None
+
+    def status_history(self, task_id: str) -> List[Tuple[str, float]]:
+        """Returns the task's recorded statuses and the unix time they were recorded at"""
+        return (
+            self.db.connect()
+            .execute(
+                "SELECT status, recorded_at FROM task_status_history "
+                "WHERE task_id = ? ORDER BY rowid",
+                (task_id,),
+            )
+            .fetchall()
+        )
+
+
+class SQLiteIPLeases:
+    """
+    IP address leases shared by all API worker processes using the same database so
+    that each process's `IPAllocator` doesn't allocate addresses leased by another
+
+    Arguments:
+        db: SQLite database
+    """
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def leased(self) -> List[str]:
+        """Returns all leased IP addresses"""
+        return [ip for (ip,) in self.db.connect().execute("SELECT ip FROM ip_leases")]
+
+    def claim(self, owner: str, ips: List[str]) -> Set[str]:
+        """
+        Leases the IP addresses to the owner if none of them are leased by another
+        owner and returns the addresses leased by other owners otherwise
+
+        Arguments:
+            owner: ID of the owner of the addresses (e.g. task ID)
+            ips: IP addresses to lease
+        """
+        if not ips:
+            return set()
+
+        placeholders = ", ".join("?" for _ in ips)
+        with self.db.transaction() as conn:
+            taken = {
+                ip
+                for (ip,) in conn.execute(
+                    f"SELECT ip FROM ip_leases WHERE ip IN ({placeholders}) AND owner != ?",
+                    ips + [owner],
+                )
+            }
+            if not taken:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO ip_leases (ip, owner) VALUES (?, ?)",
+                    [(ip, owner) for ip in ips],
+                )
+        return taken
+
+    def release(self, owner: str) -> None:
+        """Releases the IP addresses leased to the owner"""
+        conn = self.db.connect()
+        # avoids a write transaction for owners without leases (e.g. already released)
+        if conn.execute(
+            "SELECT 1 FROM ip_leases WHERE owner = ? LIMIT 1", (owner,)
+        ).fetchone():
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM ip_leases WHERE owner = ?", (owner,))
@@ -185,6 +185,7 @@ def test_multiple_run_task_calls(mock_task_role_arn):
     ecs = boto3.client("ecs", endpoint_url=os.environ.get("LOCAL_ECS_API_ENDPOINT"))
     task = ecs.register_task_definition(**task_defs["fast_success"])
 
+    task_arns = []
     expected_project_names = []
     for _ in range(3):
         response = ecs.run_task(
@@ -195,10 +196,17 @@ def test_multiple_run_task_calls(mock_task_role_arn):
 
         assert len(response["failures"]) == 0
 
+        task_arns.append(response["tasks"][0]["taskArn"])
         expected_project_names.append(
             DOCKER_PROJECT_PREFIX + response["tasks"][0]["taskArn"].split("/")[-1]
         )
 
+    # RunTask responds before the task's docker project is created
+    ecs.get_waiter("tasks_stopped").wait(
+        tasks=task_arns,
+        WaiterConfig={"Delay": 1, "MaxAttempts": 120},
+    )
+
     all_project_names = [proj.name for proj in docker.compose.ls(all=True)]
     log.debug("All docker project names:")
     log.debug(pformat(all_project_names))
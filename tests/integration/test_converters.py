@@ -0,0 +1,91 @@
+import copy
+import logging
+import os
+import shutil
+import timeit
+
+import pytest
+import yaml
+
+from local_ecs_api.converters import DockerTask, task_definition_to_compose
+from tests.data import task_defs
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ecs-cli") is None, reason="ecs-cli is not installed"
+)
+
+TASK_ROLE_ARN = "arn:aws:iam::12345679012:role/mock-task"
+
+
+def strip_input_labels(compose: dict) -> dict:
+    """
+    Removes the labels referencing the task definition input given ecs-cli
+    references the temporary task definition file path
+    """
+    compose = copy.deepcopy(compose)
+    for service in compose["services"].values():
+        for label in list(service.get("labels", {})):
+            if label.startswith("ecs-local.task-definition-input."):
+                del service["labels"][label]
+        if service.get("labels") == {}:
+            del service["labels"]
+
+    return compose
+
+
+def ecs_cli_compose(task_def: dict, tmp_path) -> dict:
+    """Returns the compose file content generated by ecs-cli"""
+    path = os.path.join(tmp_path, "docker-compose.yml")
+    DockerTask.generate_ecs_cli_task_compose_file(task_def, path)
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+@pytest.mark.parametrize("name", list(task_defs.keys()))
+def test_native_converter_matches_ecs_cli(name, tmp_path):
+    """
+    Ensures the native converter generates the same compose service attributes as
+    ecs-cli for the test task definitions
+    """
+    task_def = {"taskRoleArn": TASK_ROLE_ARN, **task_defs[name]}
+
+    expected = strip_input_labels(ecs_cli_compose(task_def, tmp_path))
+    actual = strip_input_labels(task_definition_to_compose(task_def))
+    log.debug("ecs-cli compose:\n%s", yaml.dump(expected))
+    log.debug("native compose:\n%s", yaml.dump(actual))
+
+    assert actual["version"] == expected["version"]
+    assert actual["networks"] == expected["networks"]
+    assert actual["services"].keys() == expected["services"].keys()
+    for service, attrs in expected["services"].items():
+        # the native converter additionally maps the container cpu/memory attributes
+        for attr, value in attrs.items():
+            assert actual["services"][service][attr] == value
+
+
+def test_native_converter_benchmark(tmp_path):
+    """Compares the native converter against the ecs-cli subprocess"""
+    task_def = {"taskRoleArn": TASK_ROLE_ARN, **task_defs["fast_success"]}
+    path = os.path.join(tmp_path, "docker-compose.yml")
+    number = 5
+
+    ecs_cli_time = timeit.timeit(
+        lambda: DockerTask.generate_ecs_cli_task_compose_file(task_def, path),
+        number=number,
+    )
+
+    def native():
+        with open(path, "w+") as f:
+            yaml.dump(task_definition_to_compose(task_def), f)
+
+    native_time = timeit.timeit(native, number=number)
+    log.info(
+        "Average conversion time -- ecs-cli: %.4fs native: %.4fs",
+        ecs_cli_time / number,
+        native_time / number,
+    )
+
+    assert native_time < ecs_cli_time
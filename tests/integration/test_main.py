@@ -1,4 +1,5 @@
 import logging
+import time
 import uuid
 from pprint import pformat
 
@@ -8,7 +9,7 @@ from fastapi.testclient import TestClient
 from moto import mock_ecs, mock_secretsmanager, mock_ssm, mock_sts
 from python_on_whales import docker
 
-from local_ecs_api.main import app
+from local_ecs_api.main import app, backend
 from tests.data import task_defs
 
 log = logging.getLogger(__name__)
@@ -17,6 +18,35 @@ log.setLevel(logging.DEBUG)
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def clear_task_definitions():
+    """
+    Clears the cached task definitions given each test registers its task definitions
+    within a new mocked ECS backend
+    """
+    backend.task_definitions.clear()
+    yield
+    backend.task_definitions.clear()
+
+
+def wait_for_task(task_arn: str, statuses=("STOPPED",), timeout: int = 120) -> dict:
+    """
+    Polls the DescribeTasks endpoint until the task reaches one of the input statuses
+    or is reported as a failure and returns the last DescribeTasks response
+    """
+    end = time.time() + timeout
+    while time.time() < end:
+        response = client.post(
+            "/", headers={"x-amz-target": "DescribeTasks"}, json={"tasks": [task_arn]}
+        ).json()
+        if response["failures"] or response["tasks"][0]["lastStatus"] in statuses:
+            return response
+
+        time.sleep(1)
+
+    pytest.fail(f"Task: {task_arn} did not reach statuses: {statuses}")
+
+
 @mock_ecs
 @mock_sts
 def test_list_tasks(aws_credentials):
@@ -37,6 +67,7 @@ def test_list_tasks(aws_credentials):
             "startedBy": "tester",
         },
     ).json()["tasks"][0]
+    run_task = wait_for_task(run_task["taskArn"])["tasks"][0]
 
     response = client.post(
         "/",
@@ -86,11 +117,7 @@ def test_describe_tasks_gets_updated_results(aws_credentials):
         json={"taskDefinition": task["taskDefinition"]["taskDefinitionArn"]},
     ).json()["tasks"][0]["taskArn"]
 
-    response = client.post(
-        "/", headers={"x-amz-target": "DescribeTasks"}, json={"tasks": [task_arn]}
-    )
-    assert response.status_code == 200
-    response_json = response.json()
+    response_json = wait_for_task(task_arn, statuses=("RUNNING", "STOPPED"))
 
     assert len(response_json["failures"]) == 0
     assert len(response_json["tasks"][0]["containers"]) == len(
@@ -115,8 +142,9 @@ def test_run_task_with_success():
         json={"taskDefinition": task["taskDefinition"]["taskDefinitionArn"]},
     )
     assert response.status_code == 200
+    assert response.json()["tasks"][0]["lastStatus"] == "PROVISIONING"
 
-    data = response.json()
+    data = wait_for_task(response.json()["tasks"][0]["taskArn"])
     log.debug("Response:")
     log.debug(pformat(data))
 
@@ -129,6 +157,46 @@ def test_run_task_with_success():
         assert c["lastStatus"] == "exited"
 
 
+@pytest.mark.usefixtures("aws_credentials")
+@mock_ecs
+@mock_sts
+def test_run_task_with_count():
+    """
+    Ensures RunTask endpoint launches a separate task for each of the requested count
+    """
+    ecs = boto3.client("ecs")
+    task = ecs.register_task_definition(**task_defs["fast_success"])
+    count = 3
+
+    response = client.post(
+        "/",
+        headers={"x-amz-target": "RunTask"},
+        json={
+            "taskDefinition": task["taskDefinition"]["taskDefinitionArn"],
+            "count": count,
+        },
+    )
+    assert response.status_code == 200
+
+    task_arns = [t["taskArn"] for t in response.json()["tasks"]]
+    assert len(set(task_arns)) == count
+
+    for task_arn in task_arns:
+        data = wait_for_task(task_arn)
+        assert len(data["failures"]) == 0
+
+    response = client.post(
+        "/",
+        headers={"x-amz-target": "RunTask"},
+        json={
+            "taskDefinition": task["taskDefinition"]["taskDefinitionArn"],
+            "count": 11,
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()["__type"] == "InvalidParameterException"
+
+
 @pytest.mark.usefixtures("aws_credentials")
 @mock_ecs
 @mock_sts
@@ -147,7 +215,7 @@ def test_run_task_with_failure():
     )
     assert response.status_code == 200
 
-    data = response.json()
+    data = wait_for_task(response.json()["tasks"][0]["taskArn"])
     log.debug("Response:")
     log.debug(pformat(data))
 
@@ -188,7 +256,7 @@ def test_run_task_with_overrides():
             },
         },
     )
-    response_data = response.json()
+    response_data = wait_for_task(response.json()["tasks"][0]["taskArn"])
 
     log.info("Assert override environment variables are present in task container")
     actual_env = {}
@@ -253,7 +321,7 @@ def test_run_task_pull_img_failure():
     )
     assert response.status_code == 200
 
-    response_data = response.json()
+    response_data = wait_for_task(response.json()["tasks"][0]["taskArn"])
     log.debug("Response:")
     log.debug(pformat(response_data))
 
@@ -305,7 +373,7 @@ def test_run_task_with_secrets():
     )
     assert response.status_code == 200
 
-    response_data = response.json()
+    response_data = wait_for_task(response.json()["tasks"][0]["taskArn"])
     log.debug("Response:")
     log.debug(pformat(response_data))
 
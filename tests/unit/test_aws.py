@@ -0,0 +1,165 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+
+from local_ecs_api import aws
+
+try:
+    from moto import mock_aws
+except ImportError:
+    # moto < 5 mocks each service separately
+    from moto import mock_secretsmanager, mock_ssm
+
+    def mock_aws(func):
+        return mock_ssm(mock_secretsmanager(func))
+
+
+class MockSSM:
+    def __init__(self):
+        self.calls = []
+
+    def get_parameters(self, Names, WithDecryption):
+        self.calls.append(Names)
+        params = []
+        for arn in Names:
+            name = arn.split(":")[-1].removeprefix("parameter/")
+            params.append({"Name": name, "ARN": arn, "Value": f"{name}-value"})
+        return {"Parameters": params, "InvalidParameters": []}
+
+
+class MockClientPool:
+    def __init__(self, client):
+        self._client = client
+
+    def access_key(self, credentials=None):
+        return None
+
+    def client(self, service, credentials=None):
+        return self._client
+
+
+def test_resolve_secrets_batches_and_caches(monkeypatch):
+    """Ensures secrets are deduplicated, batched and cached"""
+    monkeypatch.setattr(aws, "SECRET_CACHE", aws.TTLCache(maxsize=100, ttl=60))
+    ssm = MockSSM()
+    monkeypatch.setattr(aws, "CLIENT_POOL", MockClientPool(ssm))
+    arns = [
+        f"arn:aws:ssm:us-west-2:123456789012:parameter/param-{i}" for i in range(12)
+    ]
+
+    values = aws.resolve_secrets(arns + arns[:2])
+
+    assert values[arns[0]] == "param-0-value"
+    assert len(values) == 12
+    assert [len(names) for names in ssm.calls] == [10, 2]
+
+    aws.resolve_secrets(arns)
+    assert len(ssm.calls) == 2
+
+
+@pytest.mark.usefixtures("aws_credentials")
+@mock_aws
+def test_get_ssm_parameters_by_arn():
+    """Ensures hierarchical parameters referenced by name or ARN are resolved"""
+    ssm = boto3.client("ssm")
+    ssm.put_parameter(Name="/a/b", Value="foo", Type="SecureString")
+    arn = ssm.get_parameter(Name="/a/b")["Parameter"]["ARN"]
+    ssm.put_parameter(Name="c", Value="bar", Type="String")
+
+    assert aws.get_ssm_parameters(ssm, [arn, "/a/b", "c"]) == {
+        arn: "foo",
+        "/a/b": "foo",
+        "c": "bar",
+    }
+
+
+class MockSecretsManager:
+    def __init__(self):
+        self.batch_calls = []
+        self.calls = []
+
+    @staticmethod
+    def secret(secret_id):
+        name = secret_id.split(":")[-1].removesuffix("-AbCdEf")
+        return {
+            "ARN": f"arn:aws:secretsmanager:us-west-2:123456789012:secret:{name}-AbCdEf",
+            "Name": name,
+            "SecretString": f"{name}-value",
+        }
+
+    def batch_get_secret_value(self, SecretIdList):
+        self.batch_calls.append(SecretIdList)
+        return {"SecretValues": [self.secret(i) for i in SecretIdList], "Errors": []}
+
+    def get_secret_value(self, SecretId):
+        self.calls.append(SecretId)
+        return self.secret(SecretId)
+
+
+def test_get_secrets_manager_values_batch():
+    """Ensures secrets that can't be matched to the batch results are retrieved individually"""
+    sm = MockSecretsManager()
+    partial_arn = "arn:aws:secretsmanager:us-west-2:123456789012:secret:bar"
+    full_arn = MockSecretsManager.secret("baz")["ARN"]
+
+    values = aws.get_secrets_manager_values(sm, ["foo", partial_arn, full_arn])
+
+    assert values == {
+        "foo": "foo-value",
+        partial_arn: "bar-value",
+        full_arn: "baz-value",
+    }
+    assert sm.batch_calls == [["foo", partial_arn, full_arn]]
+    assert sm.calls == [partial_arn]
+
+
+class MockSTS:
+    calls = 0
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        MockSTS.calls += 1
+        time.sleep(0.1)
+        return {
+            "Credentials": {
+                "AccessKeyId": f"key-{MockSTS.calls}",
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": datetime.now(timezone.utc) + timedelta(seconds=10),
+            }
+        }
+
+
+def test_role_credentials_cache(monkeypatch):
+    """Ensures concurrent requests share an AssumeRole call and expiring credentials are refreshed"""
+    monkeypatch.setattr(aws, "CLIENT_POOL", MockClientPool(MockSTS()))
+    MockSTS.calls = 0
+    cache = aws.RoleCredentialsCache(refresh_margin=0)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        creds = list(executor.map(cache.get, ["arn:aws:iam::123:role/foo"] * 5))
+
+    assert MockSTS.calls == 1
+    assert {c["AccessKeyId"] for c in creds} == {"key-1"}
+
+    # credentials within the refresh margin are no longer used
+    cache.refresh_margin = timedelta(seconds=20)
+    assert cache.get("arn:aws:iam::123:role/foo")["AccessKeyId"] == "key-2"
+
+
+@pytest.mark.usefixtures("aws_credentials")
+def test_client_pool_reuses_clients():
+    """Ensures clients are reused per service, endpoint and credentials"""
+    pool = aws.ClientPool(maxsize=10, max_pool_connections=5)
+    creds = {
+        "aws_access_key_id": "foo",
+        "aws_secret_access_key": "bar",
+        "aws_session_token": "baz",
+    }
+
+    assert pool.client("ssm") is pool.client("ssm")
+    assert pool.client("ssm", creds) is pool.client("ssm", dict(creds))
+    assert pool.client("ssm", creds) is not pool.client("ssm")
+    assert pool.client("ssm").meta.config.max_pool_connections == 5
@@ -0,0 +1,67 @@
+import json
+from types import SimpleNamespace
+
+import yaml
+
+from local_ecs_api import converters
+from local_ecs_api.build import BuildContextHasher
+
+
+def test_build_context_hash(tmp_path):
+    """Ensures build context hashes only change with the build context content"""
+    (tmp_path / "Dockerfile").write_text("FROM busybox\nCOPY . .\n")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("print('foo')")
+    hasher = BuildContextHasher()
+    build = {"context": str(tmp_path), "dockerfile": "Dockerfile"}
+
+    image = hasher.image(build)
+    assert image.startswith("local-ecs-build:")
+    assert hasher.image(build) == image
+    assert hasher.image({**build, "args": {"FOO": "bar"}}) != image
+
+    (tmp_path / "src" / "main.py").write_text("print('bar')")
+    assert hasher.image(build) != image
+
+    # remote build contexts can't be hashed
+    assert hasher.image({"context": "https://github.com/foo/bar.git"}) is None
+
+
+def test_build_service_images(tmp_path, monkeypatch):
+    """Ensures only build services without an explicit image are tagged with hashes"""
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "Dockerfile").write_text("FROM busybox\n")
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text("services:\n  foo:\n    build: ./context\n")
+    build = {"context": str(context), "dockerfile": "Dockerfile"}
+    config = {
+        "services": {
+            "foo": {"build": build},
+            "bar": {"build": build, "image": "bar:latest"},
+            "baz": {"image": "busybox"},
+        }
+    }
+    monkeypatch.setattr(converters, "run", lambda *args, **kwargs: json.dumps(config))
+    monkeypatch.setattr(converters, "BUILD_CONTEXTS", BuildContextHasher())
+
+    task = converters.DockerTask.__new__(converters.DockerTask)
+    task.docker = SimpleNamespace(
+        docker_compose_cmd=["docker", "compose"],
+        client_config=SimpleNamespace(compose_files=[str(compose_file)]),
+    )
+    path = str(tmp_path / "build.yml")
+
+    # explicit images are rebuilt until they're built from the build context hash
+    assert task.generate_local_compose_build_file(path, {}) is True
+    with open(path) as f:
+        assert yaml.safe_load(f)["services"] == {
+            "foo": {"image": converters.BUILD_CONTEXTS.image(build)}
+        }
+    assert path in task.docker.client_config.compose_files
+    converters.BUILD_CONTEXTS.set_built(task.build_images)
+    assert task.generate_local_compose_build_file(path, {}) is False
+
+    (context / "Dockerfile").write_text("FROM alpine\n")
+    assert task.generate_local_compose_build_file(path, {}) is True
+    assert list(task.build_images) == ["bar:latest"]
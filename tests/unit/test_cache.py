@@ -0,0 +1,51 @@
+import time
+
+from local_ecs_api.cache import ComposeFileCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Ensures the least recently used entry is evicted once the cache is full"""
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # marks "a" as the most recently used entry
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_cache_expires_entries():
+    """Ensures entries are only returned within their time-to-live"""
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set("default", 1)
+    cache.set("no-expiration", 2, ttl=None)
+
+    time.sleep(0.1)
+
+    assert cache.get("default") is None
+    assert cache.get("no-expiration") == 2
+
+
+def test_compose_file_cache_evicts_least_recently_used(tmp_path):
+    """Ensures compose files are reused by content hash and bounded by max_entries"""
+    cache = ComposeFileCache(str(tmp_path / "cache"), max_entries=2)
+    src = tmp_path / "docker-compose.yml"
+    dest = tmp_path / "copy.yml"
+
+    keys = []
+    for i in range(3):
+        src.write_text(f"version: '{i}'")
+        keys.append(cache.key({"family": "foo", "revision": i}))
+        cache.add(keys[-1], str(src))
+        # ensures entries have distinct modification times
+        time.sleep(0.01)
+
+    assert cache.copy_to(keys[0], str(dest)) is False
+    assert cache.copy_to(keys[2], str(dest)) is True
+    assert dest.read_text() == "version: '2'"
+    assert cache.key({"revision": 2, "family": "foo"}) == keys[2]
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+from python_on_whales.client_config import Command
+from python_on_whales.components.container.models import ContainerInspectResult
+
+from local_ecs_api import docker_state
+from local_ecs_api.docker_state import COMPOSE_PROJECT_LABEL, DockerEventsWatcher
+
+
+def container(container_id: str, project: str, status: str):
+    return ContainerInspectResult.parse_obj(
+        {
+            "Id": container_id,
+            "State": {"Status": status},
+            "Config": {"Labels": {COMPOSE_PROJECT_LABEL: project}},
+        }
+    )
+
+
+def event(action: str, container_id: str, project: str):
+    return {
+        "Type": "container",
+        "Action": action,
+        "Actor": {"ID": container_id, "Attributes": {COMPOSE_PROJECT_LABEL: project}},
+    }
+
+
+def test_docker_events_watcher_handles_events(monkeypatch):
+    """Ensures the cached containers are updated from the container lifecycle events"""
+    inspected = {"a": container("a", "local-ecs-task-1", "exited")}
+    monkeypatch.setattr(
+        docker_state,
+        "inspect_containers",
+        lambda docker, ids: [inspected[i] for i in ids],
+    )
+
+    watcher = DockerEventsWatcher(None, "local-ecs-task-")
+    watcher.update(
+        [
+            container("a", "local-ecs-task-1", "running"),
+            container("b", "other-project", "running"),
+        ]
+    )
+    watcher.healthy = True
+
+    watcher._handle(event("die", "a", "local-ecs-task-1"))
+    assert [c.state.status for c in watcher.project_containers("local-ecs-task-1")] == [
+        "exited"
+    ]
+    assert watcher.project_containers("other-project") == []
+
+    watcher._handle(event("destroy", "a", "local-ecs-task-1"))
+    assert watcher.project_containers("local-ecs-task-1") == []
+
+    # the cache isn't used while the event stream is disconnected
+    watcher.healthy = False
+    assert watcher.project_containers("local-ecs-task-1") is None
+
+
+def test_list_projects_containers_inspects_project_containers(monkeypatch):
+    """Ensures only the containers of the requested projects are inspected"""
+    monkeypatch.setattr(
+        docker_state,
+        "run",
+        lambda cmd: "a local-ecs-task-1\nb local-ecs-task-2\nc local-ecs-task-3\n",
+    )
+    inspected = []
+
+    def inspect_containers(docker, ids):
+        inspected.extend(ids)
+        return [
+            container(i, f"local-ecs-task-{n}", "exited")
+            for i, n in zip(ids, ["1", "3"])
+        ]
+
+    monkeypatch.setattr(docker_state, "inspect_containers", inspect_containers)
+
+    projects = docker_state.list_projects_containers(
+        SimpleNamespace(docker_cmd=Command(["docker"])),
+        ["local-ecs-task-1", "local-ecs-task-3"],
+    )
+    assert inspected == ["a", "c"]
+    assert {name: [c.id for c in cs] for name, cs in projects.items()} == {
+        "local-ecs-task-1": ["a"],
+        "local-ecs-task-3": ["c"],
+    }
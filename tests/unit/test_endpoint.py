@@ -0,0 +1,31 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_ecs_api.endpoint import EcsEndpointManager
+
+
+def test_ecs_endpoint_is_brought_up_once(monkeypatch):
+    """Ensures concurrent launches only bring up the ECS endpoint once"""
+    endpoint = EcsEndpointManager(health_check_interval=30)
+    calls = []
+
+    def up():
+        calls.append(1)
+        time.sleep(0.1)
+        endpoint.healthy = True
+
+    monkeypatch.setattr(endpoint, "up", up)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        for _ in range(5):
+            executor.submit(endpoint.ensure_up)
+
+    assert len(calls) == 1
+
+    # the endpoint is brought up again once the health check fails
+    monkeypatch.setattr(endpoint, "check", lambda: False)
+    endpoint.start()
+    time.sleep(0.1)
+    endpoint.stop()
+
+    assert len(calls) == 2
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import wait
+from types import SimpleNamespace
+
+from python_on_whales.exceptions import NoSuchImage
+
+from local_ecs_api.images import ImagePrefetcher
+
+
+class MockImageCLI:
+    def __init__(self, on_disk):
+        self.on_disk = on_disk
+        self.pulls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def inspect(self, image):
+        if image not in self.on_disk:
+            raise NoSuchImage([], 1)
+        return SimpleNamespace(id=f"sha256:{image}")
+
+    def pull(self, image, quiet=False):
+        with self._lock:
+            self.pulls.append(image)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.1)
+        with self._lock:
+            self.active -= 1
+        return SimpleNamespace(id=f"sha256:{image}")
+
+
+def test_image_prefetcher():
+    """Ensures images are pulled once with a bounded number of concurrent pulls"""
+    image_cli = MockImageCLI(on_disk=["foo"])
+    prefetcher = ImagePrefetcher(SimpleNamespace(image=image_cli), max_workers=2)
+
+    futures = prefetcher.prefetch(["foo", "bar", "baz", "qux"])
+    # pulls that are in progress are shared
+    assert prefetcher.prefetch(["bar", "baz"]) == futures[1:3]
+    wait(futures)
+
+    assert sorted(image_cli.pulls) == ["bar", "baz", "qux"]
+    assert image_cli.max_active == 2
+    assert prefetcher.images == {
+        image: f"sha256:{image}" for image in ["foo", "bar", "baz", "qux"]
+    }
+
+    # images on disk aren't pulled again
+    assert prefetcher.prefetch(["foo", "bar"]) == []
+
+
+def test_image_prefetcher_cancels_queued_pulls():
+    """Ensures waiting for an image doesn't wait for its pull to leave the queue"""
+    image_cli = MockImageCLI(on_disk=[])
+    prefetcher = ImagePrefetcher(SimpleNamespace(image=image_cli), max_workers=1)
+
+    prefetcher.prefetch(["foo", "bar"])
+    while not image_cli.pulls:
+        time.sleep(0.01)
+
+    # bar's pull is queued behind foo's pull so it's left to the caller
+    prefetcher.wait(["bar"])
+    assert image_cli.pulls == ["foo"]
+
+    prefetcher.wait(["foo"])
+    assert prefetcher.images == {"foo": "sha256:foo"}
+    assert image_cli.pulls == ["foo"]
@@ -0,0 +1,182 @@
+import os
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from local_ecs_api import models
+
+TASK_DEF = {
+    "taskDefinition": {
+        "taskDefinitionArn": "arn:aws:ecs:us-west-2:123456789012:task-definition/foo:1",
+        "family": "foo",
+        "containerDefinitions": [
+            {"name": "foo", "image": "busybox", "essential": True}
+        ],
+    }
+}
+
+
+def task_container(project, compose_dir, status, finished_at=None):
+    return SimpleNamespace(
+        config=SimpleNamespace(
+            labels={
+                models.COMPOSE_PROJECT_LABEL: project,
+                models.COMPOSE_WORKING_DIR_LABEL: compose_dir,
+            }
+        ),
+        state=SimpleNamespace(
+            status=status,
+            # running containers report a zero finish time
+            finished_at=finished_at or datetime(1, 1, 1, tzinfo=timezone.utc),
+        ),
+    )
+
+
+def test_reconcile_tasks(monkeypatch, tmp_path):
+    """Ensures tasks are rebuilt from the task records of the docker compose projects"""
+    monkeypatch.setattr(models, "COMPOSE_DEST", str(tmp_path))
+    task = models.RunTaskBackend(TASK_DEF, cluster="default", tags=[])
+    task.compose_dir = str(tmp_path / "foo")
+    (tmp_path / "foo").mkdir()
+    task.write_record()
+
+    def container(project, status):
+        return task_container(project, task.compose_dir, status)
+
+    monkeypatch.setattr(
+        models,
+        "list_containers",
+        lambda docker, filters: [
+            container(task.docker.client_config.compose_project_name, "running"),
+            # projects without a task record are skipped
+            container(models.DOCKER_PROJECT_PREFIX + "bar", "running"),
+            container("baz", "running"),
+        ],
+    )
+
+    backend = models.ECSBackend()
+    backend.reconcile_tasks()
+
+    reconciled = backend.get_task(task.id)
+    assert reconciled.launched
+    assert reconciled.last_status == "RUNNING"
+    assert backend.list_tasks(cluster="default")[0] == [task.task_arn]
+    assert [t.id for t in backend.tasks.query({"desiredStatus": "RUNNING"})[0]] == [
+        task.id
+    ]
+
+    # tasks within the task store aren't reconciled again
+    backend.reconcile_tasks()
+    assert [t.id for t in backend.tasks.values()] == [task.id]
+
+
+def test_reconcile_tasks_skips_expired_stopped_tasks(monkeypatch, tmp_path):
+    """Ensures tasks stopped for longer than the retention period aren't reconciled"""
+    monkeypatch.setattr(models, "COMPOSE_DEST", str(tmp_path))
+    now = datetime.now(timezone.utc)
+    containers = []
+    tasks = []
+    for name, finished_at in [
+        (
+            "expired",
+            now - timedelta(seconds=models.STOPPED_TASK_RETENTION_SECONDS + 60),
+        ),
+        ("recent", now - timedelta(seconds=60)),
+    ]:
+        task = models.RunTaskBackend(TASK_DEF, cluster="default", tags=[])
+        task.compose_dir = str(tmp_path / name)
+        (tmp_path / name).mkdir()
+        task.write_record()
+        tasks.append(task)
+        containers.append(
+            task_container(
+                task.docker.client_config.compose_project_name,
+                task.compose_dir,
+                "exited",
+                finished_at,
+            )
+        )
+    monkeypatch.setattr(models, "list_containers", lambda docker, filters: containers)
+
+    backend = models.ECSBackend()
+    backend.reconcile_tasks()
+
+    assert [t.id for t in backend.tasks.values()] == [tasks[1].id]
+    assert backend.get_task(tasks[1].id).last_status == "STOPPED"
+
+
+def test_describe_task_definition_revalidates_revisions(monkeypatch):
+    """Ensures revisioned task definitions are retrieved again once their entry expires"""
+    now = [0]
+    monkeypatch.setattr("local_ecs_api.cache.time.monotonic", lambda: now[0])
+    monkeypatch.setattr(models, "IMAGE_PREFETCH", False)
+    registered = [{**TASK_DEF["taskDefinition"], "revision": 1, "registeredAt": 0}]
+
+    class ECS:
+        def describe_task_definition(self, taskDefinition):
+            return {"taskDefinition": dict(registered[-1])}
+
+    monkeypatch.setattr(
+        models, "CLIENT_POOL", SimpleNamespace(client=lambda service: ECS())
+    )
+    backend = models.ECSBackend()
+    assert (
+        backend.describe_task_definition("foo:1")["taskDefinition"]["registeredAt"] == 0
+    )
+
+    # the ECS endpoint was reset and the revision was registered again
+    registered.append({**registered[0], "registeredAt": 1})
+    assert (
+        backend.describe_task_definition("foo:1")["taskDefinition"]["registeredAt"] == 0
+    )
+
+    now[0] = models.TASK_DEFINITION_REVISION_CACHE_TTL
+    assert (
+        backend.describe_task_definition("foo:1")["taskDefinition"]["registeredAt"] == 1
+    )
+
+
+def test_reconcile_tasks_removes_orphaned_warm_tasks(monkeypatch):
+    """Ensures unclaimed warm tasks of exited API processes are removed"""
+
+    def container(project, pid):
+        return SimpleNamespace(
+            config=SimpleNamespace(
+                labels={
+                    models.COMPOSE_PROJECT_LABEL: models.DOCKER_PROJECT_PREFIX
+                    + project,
+                    models.WARM_TASK_LABEL: str(pid),
+                }
+            )
+        )
+
+    # the parent process of the test is still running
+    monkeypatch.setattr(
+        models,
+        "list_containers",
+        lambda docker, filters: [
+            container("orphaned", os.getpid()),
+            container("running", os.getppid()),
+        ],
+    )
+    removed = []
+    monkeypatch.setattr(
+        models.ECSBackend,
+        "_remove_project",
+        lambda self, project: removed.append(project),
+    )
+
+    models.ECSBackend().reconcile_tasks()
+    assert removed == [models.DOCKER_PROJECT_PREFIX + "orphaned"]
+
+
+def test_task_down_without_created_containers(monkeypatch):
+    """Ensures tasks whose containers failed to be created are still removed"""
+    calls = []
+    monkeypatch.setattr(
+        "local_ecs_api.converters.run", lambda cmd, env: calls.append((cmd[-1], env))
+    )
+    task = models.RunTaskBackend(TASK_DEF, cluster="default", tags=[])
+    task.docker = SimpleNamespace(docker_compose_cmd=["docker", "compose"])
+
+    task.down()
+    assert calls == [("down", {})]
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+from local_ecs_api.exceptions import IPAddressCapacityException
+from local_ecs_api.network import IPAllocator
+from local_ecs_api.store import SQLiteDatabase, SQLiteIPLeases
+
+
+class MockNetwork:
+    def __init__(self, subnet, container_ips):
+        self.subnet = subnet
+        self.container_ips = container_ips
+        self.inspect_calls = 0
+
+    def inspect(self, name):
+        self.inspect_calls += 1
+        return SimpleNamespace(
+            ipam=SimpleNamespace(config=[{"Subnet": self.subnet}]),
+            containers={
+                str(i): SimpleNamespace(ipv4_address=f"{ip}/29")
+                for i, ip in enumerate(self.container_ips)
+            },
+        )
+
+
+def test_ip_allocator():
+    """Ensures addresses are unique, released and bounded by the subnet"""
+    network = MockNetwork("10.0.0.0/29", ["10.0.0.2"])
+    allocator = IPAllocator(
+        SimpleNamespace(network=network), "test", reserved=["10.0.0.3"]
+    )
+
+    # network, gateway, broadcast, reserved and container addresses are skipped
+    assert allocator.allocate("foo", 2) == ["10.0.0.4", "10.0.0.5"]
+    assert allocator.allocate("bar", 1) == ["10.0.0.6"]
+    assert network.inspect_calls == 1
+
+    with pytest.raises(IPAddressCapacityException):
+        allocator.allocate("baz", 1)
+
+    allocator.release("foo")
+    assert sorted(allocator.allocate("baz", 2)) == ["10.0.0.4", "10.0.0.5"]
+
+
+def test_ip_allocator_leases(tmp_path):
+    """Ensures allocators sharing a lease store don't allocate the same addresses"""
+    leases = SQLiteIPLeases(SQLiteDatabase(str(tmp_path / "tasks.db")))
+    allocators = [
+        IPAllocator(
+            SimpleNamespace(network=MockNetwork("10.0.0.0/29", [])),
+            "test",
+            leases=leases,
+        )
+        for _ in range(2)
+    ]
+
+    assert allocators[0].allocate("foo", 2) == ["10.0.0.2", "10.0.0.3"]
+    assert allocators[1].allocate("bar", 2) == ["10.0.0.4", "10.0.0.5"]
+
+    # addresses released by any allocator are available once the subnet is resynced
+    allocators[1].release("foo")
+    assert allocators[1].allocate("baz", 1) == ["10.0.0.6"]
+    assert allocators[1].allocate("qux", 2) == ["10.0.0.2", "10.0.0.3"]
+
+
+def test_ip_allocator_resyncs_partial_reservations():
+    """Ensures reservations that run out of addresses partway resync before failing"""
+    network = MockNetwork("10.0.0.0/29", ["10.0.0.2", "10.0.0.3", "10.0.0.4"])
+    allocator = IPAllocator(SimpleNamespace(network=network), "test")
+    assert allocator.allocate("foo", 1) == ["10.0.0.5"]
+
+    # containers were removed outside of the allocator
+    network.container_ips = []
+    bar = allocator.allocate("bar", 2)
+    assert network.inspect_calls == 2
+
+    # partial reservations are rolled back
+    with pytest.raises(IPAddressCapacityException):
+        allocator.allocate("baz", 3)
+    baz = allocator.allocate("baz", 2)
+    assert sorted(["10.0.0.5"] + bar + baz) == [f"10.0.0.{i}" for i in range(2, 7)]
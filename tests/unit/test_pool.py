@@ -0,0 +1,48 @@
+import itertools
+from types import SimpleNamespace
+
+from local_ecs_api.pool import WarmTaskPool
+
+
+def task_definition(revision):
+    return {"taskDefinition": {"family": "foo", "revision": revision}}
+
+
+def test_warm_task_pool(monkeypatch):
+    """Ensures claimed, expired and outdated tasks are replaced by the refill"""
+    now = [0]
+    monkeypatch.setattr("local_ecs_api.pool.time.monotonic", lambda: now[0])
+    revision = [1]
+    ids = itertools.count()
+    removed = []
+    pool = WarmTaskPool(
+        ["foo"],
+        size=2,
+        max_age=60,
+        describe=lambda name: task_definition(revision[0]),
+        create=lambda task_def: SimpleNamespace(id=next(ids), task_def=task_def),
+        remove=lambda task: removed.append(task.id),
+    )
+
+    assert pool.claim(task_definition(1)) is None
+    pool.refill()
+    assert pool.claim(task_definition(1)).id == 1
+    assert pool.claim(task_definition(2)) is None
+
+    pool.refill()
+    assert [task.id for _, task in pool._pools["foo:1"]] == [0, 2]
+
+    # expired tasks aren't claimed
+    now[0] = 60
+    assert pool.claim(task_definition(1)) is None
+    pool.refill()
+    assert removed == [0, 2]
+
+    # tasks of the previous revision are removed once a new revision is registered
+    revision[0] = 2
+    pool.refill()
+    assert removed == [0, 2, 3, 4]
+    assert pool.claim(task_definition(2)).id == 6
+
+    pool.stop()
+    assert removed == [0, 2, 3, 4, 5]
@@ -0,0 +1,141 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+from starlette.requests import Request
+from starlette.responses import Response
+
+from local_ecs_api.proxy import EcsProxy, ResponseCache
+
+
+def ecs_request(action: str, body: dict) -> Request:
+    content = json.dumps(body).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": content, "more_body": False}
+
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/",
+            "headers": [
+                (
+                    b"x-amz-target",
+                    f"AmazonEC2ContainerServiceV20141113.{action}".encode(),
+                ),
+                (b"content-type", b"application/x-amz-json-1.1"),
+            ],
+        },
+        receive,
+    )
+
+
+def test_proxy_cache():
+    """Ensures read-only responses are cached until a mutating action invalidates them"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.headers["x-amz-target"].split(".")[-1])
+        return httpx.Response(200, json={"calls": len(calls)})
+
+    proxy = EcsProxy(
+        "http://ecs",
+        max_connections=1,
+        max_keepalive_connections=1,
+        timeout=1,
+        cache=ResponseCache(["DescribeTaskDefinition"], ttl=30, maxsize=10),
+    )
+    proxy.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def forward(action: str, body: dict) -> dict:
+        response = await proxy.forward(ecs_request(action, body))
+        return json.loads(response.body)
+
+    async def run():
+        first = await forward(
+            "DescribeTaskDefinition", {"taskDefinition": "foo", "include": []}
+        )
+        # key order doesn't affect the cache key
+        second = await forward(
+            "DescribeTaskDefinition", {"include": [], "taskDefinition": "foo"}
+        )
+        assert first == second
+        assert calls == ["DescribeTaskDefinition"]
+
+        # mutating actions are streamed rather than cached
+        await proxy.forward(ecs_request("RegisterTaskDefinition", {"family": "foo"}))
+        third = await forward(
+            "DescribeTaskDefinition", {"taskDefinition": "foo", "include": []}
+        )
+        assert third != first
+
+    asyncio.run(run())
+
+    assert calls == [
+        "DescribeTaskDefinition",
+        "RegisterTaskDefinition",
+        "DescribeTaskDefinition",
+    ]
+    assert proxy.cache.stats() == {
+        "hits": 1,
+        "misses": 2,
+        "invalidations": 1,
+        "size": 1,
+    }
+
+
+def test_proxy_cache_in_flight_invalidation():
+    """
+    Ensures responses read while a mutating action is in flight aren't cached and
+    that cached responses don't keep the upstream content encoding
+    """
+    revision = [1]
+    released = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        action = request.headers["x-amz-target"].split(".")[-1]
+        if action == "RegisterTaskDefinition":
+            revision[0] += 1
+            return httpx.Response(200, json={})
+
+        content = json.dumps({"revision": revision[0]}).encode()
+        if revision[0] == 1:
+            # the read is answered before the mutation but returns after it
+            await released.wait()
+        return httpx.Response(
+            200,
+            content=gzip.compress(content),
+            headers={"content-encoding": "gzip"},
+        )
+
+    proxy = EcsProxy(
+        "http://ecs",
+        max_connections=2,
+        max_keepalive_connections=2,
+        timeout=1,
+        cache=ResponseCache(["DescribeTaskDefinition"], ttl=30, maxsize=10),
+    )
+    proxy.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def describe() -> Response:
+        return await proxy.forward(
+            ecs_request("DescribeTaskDefinition", {"taskDefinition": "foo"})
+        )
+
+    async def run():
+        stale = asyncio.create_task(describe())
+        await asyncio.sleep(0)
+        await proxy.forward(ecs_request("RegisterTaskDefinition", {"family": "foo"}))
+        released.set()
+        assert json.loads((await stale).body) == {"revision": 1}
+
+        response = await describe()
+        assert json.loads(response.body) == {"revision": 2}
+        assert "content-encoding" not in response.headers
+        assert json.loads((await describe()).body) == {"revision": 2}
+
+    asyncio.run(run())
+
+    assert proxy.cache.stats()["hits"] == 1
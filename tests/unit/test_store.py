@@ -0,0 +1,165 @@
+from types import SimpleNamespace
+
+import pytest
+
+from local_ecs_api.exceptions import InvalidParameterException
+from local_ecs_api.store import SQLiteDatabase, SQLiteTaskStore, TaskStore
+
+
+def test_task_store_query_pagination():
+    """Ensures queries intersect the indexes and resume from the pagination token"""
+    store = TaskStore(
+        {"family": lambda task: task.family, "status": lambda task: task.status}
+    )
+    tasks = [
+        SimpleNamespace(id=str(i), family="foo" if i % 2 else "bar", status="RUNNING")
+        for i in range(6)
+    ]
+    for task in tasks:
+        store.add(task)
+
+    tasks[1].status = "STOPPED"
+    store.reindex(tasks[1])
+
+    tasks, token = store.query({"family": "foo", "status": "RUNNING"})
+    assert [task.id for task in tasks] == ["3", "5"]
+    assert token is None
+
+    tasks, token = store.query({"family": "foo"}, max_results=2)
+    assert [task.id for task in tasks] == ["1", "3"]
+    tasks, token = store.query({"family": "foo"}, next_token=token, max_results=2)
+    assert [task.id for task in tasks] == ["5"]
+    assert token is None
+
+    _, token = store.query({}, max_results=3)
+    tasks, token = store.query({}, next_token=token, max_results=3)
+    assert [task.id for task in tasks] == ["3", "4", "5"]
+    assert token is None
+
+    assert store.query({"status": "PENDING"}) == ([], None)
+
+
+def test_task_store_invalid_token():
+    """Ensures invalid pagination tokens raise a client error"""
+    store = TaskStore({})
+    with pytest.raises(InvalidParameterException):
+        store.query({}, next_token="invalid")
+
+
+def test_task_store_evicts_stopped_tasks(monkeypatch):
+    """Ensures the oldest stopped tasks are evicted while running tasks are kept"""
+    now = [0]
+    monkeypatch.setattr("local_ecs_api.store.time.monotonic", lambda: now[0])
+    store = TaskStore(
+        {"status": lambda task: task.status},
+        is_stopped=lambda task: task.status == "STOPPED",
+        max_stopped=2,
+        stopped_ttl=60,
+    )
+    tasks = [SimpleNamespace(id=str(i), status="RUNNING") for i in range(4)]
+    for task in tasks:
+        store.add(task)
+
+    for task in tasks[:3]:
+        task.status = "STOPPED"
+        store.reindex(task)
+
+    with pytest.raises(KeyError):
+        store.get("0")
+    assert [task.id for task in store.query({"status": "STOPPED"})[0]] == ["1", "2"]
+
+    now[0] = 60
+    assert [task.id for task in store.values()] == ["3"]
+    assert store.query({"status": "STOPPED"}) == ([], None)
+
+
+class MockTask(SimpleNamespace):
+    def to_record(self):
+        return vars(self)
+
+
+def test_sqlite_task_store(tmp_path):
+    """Ensures tasks are shared by stores using the same database"""
+    path = str(tmp_path / "tasks.db")
+
+    def sqlite_store():
+        return SQLiteTaskStore(
+            SQLiteDatabase(path),
+            {"status": lambda task: task.status},
+            load=lambda record: MockTask(**record),
+            is_stopped=lambda task: task.status == "STOPPED",
+            max_stopped=1,
+            status_key=lambda task: task.status,
+        )
+
+    store = sqlite_store()
+    tasks = [MockTask(id=str(i), status="RUNNING") for i in range(3)]
+    for task in tasks:
+        store.add(task)
+
+    # tasks are loaded from the database by other stores
+    other = sqlite_store()
+    assert other.get("1") == tasks[1]
+    assert [task.id for task in other.query({"status": "RUNNING"})[0]] == [
+        "0",
+        "1",
+        "2",
+    ]
+
+    for task in tasks[:2]:
+        task.status = "STOPPED"
+        store.reindex(task)
+
+    with pytest.raises(KeyError):
+        other.get("0")
+    assert other.get("1").status == "STOPPED"
+    assert [status for status, _ in other.status_history("1")] == ["RUNNING", "STOPPED"]
+
+    tasks, token = other.query({}, max_results=1)
+    assert [task.id for task in tasks] == ["1"]
+    tasks, token = other.query({}, next_token=token, max_results=1)
+    assert [task.id for task in tasks] == ["2"]
+    assert token is None
+
+
+def test_task_store_indexes_without_lock():
+    """Ensures index values (e.g. docker-derived status) are computed without the lock"""
+    store = TaskStore({"locked": lambda task: store._lock.locked()})
+    task = SimpleNamespace(id="0")
+    store.add(task)
+    store.reindex(task)
+
+    assert store.query({"locked": False})[0] == [task]
+
+
+def test_sqlite_task_store_skips_stale_updates(tmp_path):
+    """Ensures stale task instances don't overwrite records updated by other workers"""
+    path = str(tmp_path / "tasks.db")
+    store = SQLiteTaskStore(
+        SQLiteDatabase(path),
+        {"status": lambda task: task.status},
+        load=lambda record: MockTask(**record),
+    )
+    other = SQLiteTaskStore(
+        SQLiteDatabase(path),
+        {"status": lambda task: task.status},
+        load=lambda record: MockTask(**record),
+    )
+    task = MockTask(id="0", status="RUNNING", reason=None)
+    store.add(task)
+
+    stale = other.get("0")
+    task.status = "STOPPED"
+    task.reason = "Essential container exited"
+    store.reindex(task)
+
+    stale.reason = "Overwritten"
+    other.reindex(stale)
+    assert other.get("0").reason == "Essential container exited"
+    assert other.query({"status": "STOPPED"})[0] == [task]
+
+    # instances loaded from the latest record can be updated
+    latest = other.get("0")
+    latest.reason = "Updated"
+    other.reindex(latest)
+    assert store.get("0").reason == "Updated"